@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+# coding: utf8
+#
+# Teste de carga do servico.py: mede a vazão sustentada e a latência
+#
+# (c) Copyright 2009 by Narcelio Filho <narcelio@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+'''
+uso: carga.py [endereco:]porta [conexoes] [segundos] [caminho]
+
+Cada conexão é uma thread que repete o pedido, mantendo a conexão aberta, até
+o fim do tempo. O caminho padrão é /valida com um CPF aleatório; "{doc}" no
+caminho é trocado por um número de 11 dígitos diferente a cada pedido.
+'''
+
+import random
+import sys
+from httplib import HTTPConnection
+from threading import Thread
+from time import time
+
+
+def _carrega(endereco, porta, caminho, fim, latencias, codigos):
+    conexao = HTTPConnection(endereco, porta)
+    while time() < fim:
+        url = caminho.replace('{doc}', '%011d' % random.randint(0, 10 ** 11 - 1))
+        inicio = time()
+        conexao.request('GET', url)
+        resposta = conexao.getresponse()
+        resposta.read()
+        # list.append() é atômico, então as threads podem compartilhar listas
+        latencias.append(time() - inicio)
+        codigos.append(resposta.status)
+    conexao.close()
+
+
+def percentil(valores, p):
+    return valores[min(len(valores) - 1, int(len(valores) * p / 100.0))]
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        print __doc__.split('\n\n')[0].strip()
+        sys.exit(1)
+
+    endereco, _, porta = sys.argv[1].rpartition(':')
+    conexoes = len(sys.argv) > 2 and int(sys.argv[2]) or 16
+    segundos = len(sys.argv) > 3 and float(sys.argv[3]) or 10
+    caminho = len(sys.argv) > 4 and sys.argv[4] or '/valida?doc={doc}'
+
+    latencias = []
+    codigos = []
+    inicio = time()
+    threads = [Thread(target=_carrega,
+                      args=(endereco or '127.0.0.1', int(porta), caminho,
+                            inicio + segundos, latencias, codigos))
+               for _ in xrange(conexoes)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    duracao = time() - inicio
+
+    latencias.sort()
+    print '%d pedidos em %.1fs: %.0f pedidos/s' % (
+        len(latencias), duracao, len(latencias) / duracao)
+    print 'latência (ms): p50 %.1f  p95 %.1f  p99 %.1f  máx %.1f' % tuple(
+        1000 * valor for valor in (percentil(latencias, 50),
+                                   percentil(latencias, 95),
+                                   percentil(latencias, 99),
+                                   latencias[-1]))
+    print 'respostas:', ', '.join('%d: %d' % (codigo, codigos.count(codigo))
+                                  for codigo in sorted(set(codigos)))
+
+
+# vim:tabstop=4:expandtab:smartindent:encoding=utf8
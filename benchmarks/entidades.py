@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+# coding: utf8
+#
+# Compara a decodificação de células de texto.decodifica() com a de
+# scraper.html2unicode()
+#
+# (c) Copyright 2009 by Narcelio Filho <narcelio@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+'''
+uso: entidades.py [repeticoes]
+
+As células vêm de exemplos/resultado-*.csv, com os acentos e o "&" escritos
+como entidades HTML, como nas páginas do TSE. Todas são decodificadas por
+html2unicode(), por decodifica() sem cache (cada valor é novo), com cache e por
+decodifica_tabela(); os resultados precisam ser idênticos.
+'''
+
+import os
+import sys
+from csv import reader as csv_reader
+from htmlentitydefs import codepoint2name
+from time import time
+
+import texto
+from scraper import html2unicode
+
+
+EXEMPLOS = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                        '..', 'exemplos')
+
+
+def escapa(valor):
+    '''Escreve "&" e os caracteres fora do ASCII como entidades HTML'''
+    partes = []
+    for caractere in valor.replace(u'&', u'&amp;'):
+        codigo = ord(caractere)
+        if codigo < 128:
+            partes.append(caractere)
+        elif codigo in codepoint2name:
+            partes.append(u'&%s;' % codepoint2name[codigo])
+        else:
+            partes.append(u'&#%d;' % codigo)
+    return u''.join(partes)
+
+
+def tabela():
+    linhas = []
+    for ano in (2004, 2006, 2008):
+        arquivo = open(os.path.join(EXEMPLOS, 'resultado-%d.csv' % ano), 'rb')
+        try:
+            for linha in list(csv_reader(arquivo))[1:]:
+                linhas.append([escapa(campo.decode('utf8')) for campo in linha])
+        finally:
+            arquivo.close()
+    return linhas
+
+
+def mede(nome, funcao, celulas, referencia=None):
+    inicio = time()
+    resultado = funcao()
+    duracao = time() - inicio
+    if referencia is not None and resultado != referencia:
+        print '%s: resultado diferente de html2unicode()!' % nome
+        sys.exit(1)
+    print '%-24s %8.2fs %9.2f us/célula' % (nome, duracao,
+                                            duracao * 1e6 / celulas)
+    return resultado, duracao
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 2:
+        print __doc__.split('\n\n')[0].strip()
+        sys.exit(1)
+
+    repeticoes = 20
+    if len(sys.argv) == 2:
+        repeticoes = int(sys.argv[1])
+
+    linhas = tabela() * repeticoes
+    celulas = sum(len(linha) for linha in linhas)
+    print '%d linhas, %d células' % (len(linhas), celulas)
+
+    referencia, lento = mede('html2unicode()',
+        lambda: [[html2unicode(c) for c in linha] for linha in linhas], celulas)
+    _, frio = mede('decodifica() sem cache',
+        lambda: [[texto._decodifica(c) for c in linha] for linha in linhas],
+        celulas, referencia)
+    _, quente = mede('decodifica()',
+        lambda: [[texto.decodifica(c) for c in linha] for linha in linhas],
+        celulas, referencia)
+    _, tabela_ = mede('decodifica_tabela()',
+        lambda: texto.decodifica_tabela(linhas), celulas, referencia)
+
+    print 'resultados idênticos; %.0fx sem cache, %.0fx com cache, ' \
+          '%.0fx por tabela' % (lento / frio, lento / quente, lento / tabela_)
+
+
+# vim:tabstop=4:expandtab:smartindent:encoding=utf8
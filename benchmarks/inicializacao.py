@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+# coding: utf8
+#
+# Mede o tempo de inicialização de filter_valid.py, comparando com a carga
+# imediata de mechanize e BeautifulSoup que acontecia antes
+#
+# (c) Copyright 2009 by Narcelio Filho <narcelio@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+'''
+uso: inicializacao.py [repeticoes]
+
+Cada caso é executado num processo novo, com a entrada padrão vazia.
+'''
+
+import os
+import subprocess
+import sys
+from time import time
+
+
+RAIZ = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+CASOS = [
+    ('interpretador', ['-c', 'pass']),
+    ('filter_valid.py', [os.path.join(RAIZ, 'filter_valid.py')]),
+    ('carga imediata', ['-c', 'import scraper; scraper.carrega_dependencias();'
+                              ' import tse.prestacao_de_contas']),
+]
+
+
+def mede(argumentos, repeticoes):
+    ambiente = dict(os.environ, PYTHONPATH=RAIZ)
+    tempos = []
+    nulo = open(os.devnull, 'r+b')
+    try:
+        for _ in xrange(repeticoes):
+            inicio = time()
+            subprocess.check_call([sys.executable, '-W', 'ignore'] + argumentos,
+                                  stdin=nulo, stdout=nulo, env=ambiente)
+            tempos.append(time() - inicio)
+    finally:
+        nulo.close()
+    tempos.sort()
+    return tempos[0], tempos[len(tempos) // 2]
+
+
+if __name__ == '__main__':
+    repeticoes = 20
+    if len(sys.argv) > 1:
+        repeticoes = int(sys.argv[1])
+
+    print '%-16s %10s %10s' % ('caso', 'mínimo', 'mediana')
+    for nome, argumentos in CASOS:
+        minimo, mediana = mede(argumentos, repeticoes)
+        print '%-16s %9.1fms %9.1fms' % (nome, minimo * 1000, mediana * 1000)
+
+
+# vim:tabstop=4:expandtab:smartindent:encoding=utf8
@@ -0,0 +1,62 @@
+#!/usr/bin/env python
+# coding: utf8
+#
+# Reprocessa respostas gravadas com scraper.usa_arquivo(), sem acessar a rede,
+# e mede a velocidade da extração de doador_<ano>
+#
+# (c) Copyright 2009 by Narcelio Filho <narcelio@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+'''
+uso: reprocessamento.py arquivo.db ano < documentos
+
+Para gravar o arquivo, basta rodar as consultas normalmente depois de
+scraper.usa_arquivo('arquivo.db'). Os documentos cujas respostas não estão no
+arquivo são contados como faltando.
+'''
+
+import sys
+from time import time
+
+import scraper
+from tse.prestacao_de_contas import doadores
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 3:
+        print __doc__.split('\n\n')[0].strip()
+        sys.exit(1)
+
+    scraper.usa_arquivo(sys.argv[1], reproduz=True)
+    consulta = doadores[int(sys.argv[2])]
+
+    documentos = [linha.strip() for linha in sys.stdin if linha.strip()]
+    encontrados = faltando = 0
+    inicio = time()
+    for documento in documentos:
+        try:
+            if consulta(documento):
+                encontrados += 1
+        except scraper.mechanize.URLError:
+            faltando += 1
+    duracao = time() - inicio
+
+    print '%d documentos em %.2fs (%.1f/s), %d com doações, %d faltando' % (
+        len(documentos), duracao, len(documentos) / max(duracao, 1e-9),
+        encontrados, faltando)
+
+
+# vim:tabstop=4:expandtab:smartindent:encoding=utf8
@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+# coding: utf8
+#
+# cache.py
+#
+# Cache LRU limitado e seguro entre threads
+#
+# (c) Copyright 2009 by Narcelio Filho <narcelio@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+from collections import OrderedDict
+from threading import Lock
+from time import time
+
+
+class Cache(object):
+    '''
+    Cache LRU limitado, com validade opcional em segundos.
+
+    >>> cache = Cache(2)
+    >>> cache.guarda('a', 1); cache.guarda('b', 2); cache.guarda('c', 3)
+    >>> cache.busca('a') is Cache.AUSENTE, cache.busca('c')
+    (True, 3)
+    >>> cache = Cache(2, validade=-1)
+    >>> cache.guarda('a', 1)
+    >>> cache.busca('a') is Cache.AUSENTE
+    True
+    '''
+
+    AUSENTE = object()
+
+    def __init__(self, tamanho, validade=None):
+        self.tamanho = tamanho
+        self.validade = validade
+        self._itens = OrderedDict()
+        self._trava = Lock()
+
+
+    def busca(self, chave):
+        '''Retorna o valor guardado, ou Cache.AUSENTE'''
+        with self._trava:
+            try:
+                instante, valor = self._itens.pop(chave)
+            except KeyError:
+                return self.AUSENTE
+            if self.validade is not None and time() - instante > self.validade:
+                return self.AUSENTE
+            self._itens[chave] = instante, valor
+            return valor
+
+
+    def guarda(self, chave, valor):
+        with self._trava:
+            self._itens.pop(chave, None)
+            self._itens[chave] = time(), valor
+            while len(self._itens) > self.tamanho:
+                self._itens.popitem(last=False)
+
+
+if __name__ == "__main__":
+    import doctest
+    doctest.testmod()
+
+
+# vim:tabstop=4:expandtab:smartindent:encoding=utf8
@@ -0,0 +1,208 @@
+#!/usr/bin/env python
+# coding: utf8
+#
+# cruzamento.py
+#
+# Cruza duas listas grandes de CNPJs e CPFs, como a "lista suja" do trabalho
+# escravo e uma base local de doações
+#
+# (c) Copyright 2009 by Narcelio Filho <narcelio@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+'''
+uso: cruzamento.py [-d delim] [-D delim] lista.csv coluna doacoes.csv coluna
+
+As colunas podem ser o número (a partir de 0) ou o nome no cabeçalho. Os
+arquivos são separados por vírgulas, ou pelo delimitador de -d (lista) e -D
+(doações), como "-d ';'" ou "-d tab". A saída tem as colunas da lista seguidas
+das colunas da doação, uma linha por par.
+
+A lista é carregada num dicionário enquanto couber em "limite" linhas. Se
+passar disso, as duas entradas são particionadas em disco pelo documento
+(hash join particionado) e cada partição é cruzada separadamente, de forma que
+a memória usada fica limitada ao tamanho de uma partição da lista.
+
+>>> lista = [['Empresa A', '11.222.333/0001-81'], ['Pessoa', '560.683.325-51']]
+>>> doacoes = [['11222333000181', '100,00'], ['123', '1,00'],
+...            ['560.683.325-51', '5,00'], ['11222333000181', '7,00']]
+>>> sorted(cruza(lista, doacoes, 1, 0))
+[('11222333000181', ['Empresa A', '11.222.333/0001-81'], ['11222333000181', '100,00']), ('11222333000181', ['Empresa A', '11.222.333/0001-81'], ['11222333000181', '7,00']), ('56068332551', ['Pessoa', '560.683.325-51'], ['560.683.325-51', '5,00'])]
+>>> sorted(cruza(lista, doacoes, 1, 0, limite=1, particoes=3)) == sorted(cruza(lista, doacoes, 1, 0))
+True
+'''
+
+import csv
+import logging
+import os
+import shutil
+import sys
+import tempfile
+
+from entrada import delimitador
+from entrada import normaliza
+
+
+LIMITE = 1000000
+PARTICOES = 64
+
+
+def cruza(lista, doacoes, coluna_lista=0, coluna_doacoes=0,
+          limite=LIMITE, particoes=PARTICOES, diretorio=None):
+    '''
+    Gera tuplas (documento, linha da lista, linha da doação) para cada doação
+    cujo CNPJ ou CPF aparece na lista. lista e doacoes são iteráveis de linhas
+    (listas de campos), como os de csv.reader(); linhas com documento inválido
+    são ignoradas.
+    '''
+
+    lista = _normalizadas(lista, coluna_lista)
+    doacoes = _normalizadas(doacoes, coluna_doacoes)
+
+    tabela = {}
+    carregadas = 0
+    for documento, linha in lista:
+        tabela.setdefault(documento, []).append(linha)
+        carregadas += 1
+        if carregadas > limite:
+            break
+    else:
+        # a lista inteira coube na memória
+        return _sonda(tabela, doacoes)
+
+    logging.info('Lista com mais de %d linhas, particionando em disco' % limite)
+    return _cruza_particionado(tabela, lista, doacoes, particoes, diretorio)
+
+
+def _normalizadas(linhas, coluna):
+    for linha in linhas:
+        try:
+            documento = normaliza(linha[coluna])
+        except IndexError:
+            continue
+        if documento is not None:
+            yield documento, linha
+
+
+def _sonda(tabela, doacoes):
+    for documento, linha in doacoes:
+        for linha_lista in tabela.get(documento, ()):
+            yield documento, linha_lista, linha
+
+
+def _cruza_particionado(tabela, lista, doacoes, particoes, diretorio):
+    diretorio = tempfile.mkdtemp(prefix='cruzamento-', dir=diretorio)
+    try:
+        def particao(documento):
+            return int(documento) % particoes
+
+        # o que já estava na memória vai para as partições junto com o resto
+        carregadas = ((documento, linha)
+                      for documento, linhas in tabela.iteritems()
+                      for linha in linhas)
+        _particiona(diretorio, 'lista', particoes, particao, carregadas)
+        _particiona(diretorio, 'lista', particoes, particao, lista, 'ab')
+        tabela.clear()
+
+        _particiona(diretorio, 'doacoes', particoes, particao, doacoes)
+
+        for numero in xrange(particoes):
+            tabela = {}
+            for linha in _le_particao(diretorio, 'lista', numero):
+                tabela.setdefault(linha[0], []).append(linha[1:])
+            if not tabela:
+                continue
+            doacoes = ((linha[0], linha[1:])
+                       for linha in _le_particao(diretorio, 'doacoes', numero))
+            for resultado in _sonda(tabela, doacoes):
+                yield resultado
+    finally:
+        shutil.rmtree(diretorio, ignore_errors=True)
+
+
+def _particiona(diretorio, nome, particoes, particao, linhas, modo='wb'):
+    arquivos = [open(_caminho(diretorio, nome, numero), modo)
+                for numero in xrange(particoes)]
+    try:
+        escritores = [csv.writer(arquivo) for arquivo in arquivos]
+        for documento, linha in linhas:
+            escritores[particao(documento)].writerow([documento] + linha)
+    finally:
+        for arquivo in arquivos:
+            arquivo.close()
+
+
+def _le_particao(diretorio, nome, numero):
+    arquivo = open(_caminho(diretorio, nome, numero), 'rb')
+    try:
+        for linha in csv.reader(arquivo):
+            yield linha
+    finally:
+        arquivo.close()
+
+
+def _caminho(diretorio, nome, numero):
+    return os.path.join(diretorio, '%s-%04d.csv' % (nome, numero))
+
+
+def _coluna(cabecalho, coluna):
+    if coluna.isdigit():
+        return int(coluna)
+    try:
+        return cabecalho.index(coluna)
+    except ValueError:
+        raise ValueError('Coluna desconhecida: %r' % coluna)
+
+
+if __name__ == '__main__':
+    from getopt import GetoptError
+    from getopt import getopt
+
+    def uso(erro=None):
+        if erro is not None:
+            print >>sys.stderr, erro
+        print __doc__.split('\n\n')[0].strip()
+        sys.exit(1)
+
+    try:
+        opcoes, argumentos = getopt(sys.argv[1:], 'd:D:')
+        opcoes = dict(opcoes)
+        delimitador_lista = delimitador(opcoes.get('-d', ','))
+        delimitador_doacoes = delimitador(opcoes.get('-D', ','))
+    except (GetoptError, ValueError), e:
+        uso(e)
+    if len(argumentos) != 4:
+        uso()
+
+    arquivo_lista = open(argumentos[0], 'rb')
+    arquivo_doacoes = open(argumentos[2], 'rb')
+    lista = csv.reader(arquivo_lista, delimiter=delimitador_lista)
+    doacoes = csv.reader(arquivo_doacoes, delimiter=delimitador_doacoes)
+    cabecalho_lista = lista.next()
+    cabecalho_doacoes = doacoes.next()
+    try:
+        coluna_lista = _coluna(cabecalho_lista, argumentos[1])
+        coluna_doacoes = _coluna(cabecalho_doacoes, argumentos[3])
+    except ValueError, e:
+        uso(e)
+
+    saida = csv.writer(sys.stdout)
+    saida.writerow(cabecalho_lista + cabecalho_doacoes)
+    for documento, linha_lista, linha_doacao in cruza(
+            lista, doacoes, coluna_lista, coluna_doacoes):
+        saida.writerow(linha_lista + linha_doacao)
+
+
+# vim:tabstop=4:expandtab:smartindent:encoding=utf8
@@ -0,0 +1,273 @@
+#!/usr/bin/env python
+# coding: utf8
+#
+# entrada.py
+#
+# Leitura de listas enormes de CNPJs e CPFs direto de arquivos mapeados em
+# memória
+#
+# (c) Copyright 2009 by Narcelio Filho <narcelio@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+'''
+Os arquivos são mapeados com mmap e os tokens são fatias de bytes do mapa, sem
+passar por str.strip(), unicode ou pelas classes Cnpj e Cpf. A validação é
+feita sobre os próprios bytes e tem o mesmo resultado de
+tse.prestacao_de_contas.pessoa_or_valueerror():
+
+>>> normaliza('11.222.333/0001-81')
+'11222333000181'
+>>> normaliza('560.683.325-51')
+'56068332551'
+>>> normaliza('111.111.111-11') is None
+True
+>>> formata(normaliza('56068332551'))
+'560.683.325-51'
+'''
+
+import mmap
+from re import compile as regexp
+
+
+_PALAVRA = regexp(r'[^\s,;]+')
+
+# '.', '-' e '/' são ignorados, como em Cnpj() e Cpf()
+_PONTO, _TRACO, _BARRA = ord('.'), ord('-'), ord('/')
+_ZERO, _NOVE = ord('0'), ord('9')
+
+_PESOS_CNPJ = (6, 5, 4, 3, 2, 9, 8, 7, 6, 5, 4, 3, 2)
+_PESOS_CPF = (11, 10, 9, 8, 7, 6, 5, 4, 3, 2)
+
+
+def mapeia(caminho):
+    '''Mapeia o arquivo em memória, só para leitura. Retorna None se o arquivo
+    estiver vazio, já que não é possível mapear zero bytes.'''
+    arquivo = open(caminho, 'rb')
+    try:
+        try:
+            return mmap.mmap(arquivo.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            return None
+    finally:
+        arquivo.close()
+
+
+def tokens(caminho, coluna=None, delimitador=',', cabecalho=False):
+    '''
+    Gera os tokens do arquivo como fatias de bytes.
+
+    Sem coluna, cada palavra separada por espaços, vírgulas ou ponto e vírgula
+    é um token, como em "tr , ' ' | filter_valid.py". Com coluna (índice a
+    partir de 0 ou nome do cabeçalho), cada linha é tratada como um registro
+    CSV e só o campo escolhido é extraído, sem aspas. Nomes de coluna implicam
+    cabecalho=True, e um nome que não está no cabeçalho levanta ValueError.
+
+    Delimitadores entre aspas fazem parte do campo:
+
+    >>> import os, tempfile
+    >>> descritor, caminho = tempfile.mkstemp()
+    >>> arquivo = os.fdopen(descritor, 'w')
+    >>> arquivo.write('"Nome";"Valor";"CNPJ ou CPF"\\r\\n'
+    ...               '"Silva; Filhos";"4.000,00";"11.222.333/0001-81"\\r\\n')
+    >>> arquivo.close()
+    >>> list(tokens(caminho, 'CNPJ ou CPF', delimitador=';'))
+    ['11.222.333/0001-81']
+    >>> list(tokens(caminho, 1, delimitador=';', cabecalho=True))
+    ['4.000,00']
+    >>> list(tokens(caminho, 'CPF', delimitador=';'))
+    Traceback (most recent call last):
+    ...
+    ValueError: Coluna desconhecida: 'CPF'
+    >>> os.remove(caminho)
+    '''
+
+    mapa = mapeia(caminho)
+    if mapa is None:
+        return
+
+    try:
+        if coluna is None:
+            for palavra in _PALAVRA.finditer(mapa):
+                yield mapa[palavra.start():palavra.end()]
+            return
+
+        inicio = 0
+        fim_do_mapa = len(mapa)
+
+        if cabecalho or not isinstance(coluna, int):
+            fim = _fim_da_linha(mapa, inicio)
+            if not isinstance(coluna, int):
+                coluna = _indice(mapa, inicio, fim, coluna, delimitador)
+            inicio = fim + 1
+
+        while inicio < fim_do_mapa:
+            fim = _fim_da_linha(mapa, inicio)
+            campo = _campo(mapa, inicio, fim, coluna, delimitador)
+            if campo:
+                yield campo
+            inicio = fim + 1
+    finally:
+        mapa.close()
+
+
+def _fim_da_linha(mapa, inicio):
+    fim = mapa.find('\n', inicio)
+    if fim < 0:
+        fim = len(mapa)
+    return fim
+
+
+def _campo(mapa, inicio, fim, coluna, delimitador):
+    '''Extrai o campo coluna da linha mapa[inicio:fim], procurando apenas os
+    delimitadores necessários'''
+    atual = 0
+    while True:
+        final = inicio
+        if mapa[inicio:inicio + 1] == '"':
+            # entre aspas pode haver delimitadores; "" é uma aspa escapada
+            final = inicio + 1
+            while True:
+                final = mapa.find('"', final, fim)
+                if final < 0 or mapa[final + 1:final + 2] != '"':
+                    break
+                final += 2
+            if final < 0:
+                final = fim
+        final = mapa.find(delimitador, final, fim)
+        if final < 0:
+            final = fim
+        if atual == coluna:
+            break
+        if final == fim:
+            return None
+        inicio = final + 1
+        atual += 1
+
+    # descarta espaços, '\r' e aspas sem copiar a linha
+    while inicio < final and mapa[inicio] in ' \t"':
+        inicio += 1
+    while final > inicio and mapa[final - 1] in ' \t\r"':
+        final -= 1
+
+    return mapa[inicio:final]
+
+
+def _indice(mapa, inicio, fim, nome, delimitador):
+    '''Posição da coluna nome no cabeçalho mapa[inicio:fim]'''
+    posicao = 0
+    while True:
+        campo = _campo(mapa, inicio, fim, posicao, delimitador)
+        if campo is None:
+            raise ValueError('Coluna desconhecida: %r' % nome)
+        if campo == nome:
+            return posicao
+        posicao += 1
+
+
+def _digitos(token):
+    '''Retorna a lista de dígitos do token (bytes) e se ele tinha '/', ou None
+    se houver algum caractere que não seja dígito, '.', '-' ou '/'.'''
+    digitos = []
+    barra = False
+    for c in bytearray(token):
+        if _ZERO <= c <= _NOVE:
+            digitos.append(c - _ZERO)
+        elif c == _BARRA:
+            barra = True
+        elif c != _PONTO and c != _TRACO:
+            return None, barra
+    return digitos, barra
+
+
+def _verificadores(digitos, pesos):
+    '''Calcula os dois dígitos verificadores e os compara com os do final'''
+    n = len(pesos) - 1
+    for i in (0, 1):
+        r = sum([d * p for (d, p) in zip(digitos[:n + i], pesos[1 - i:])]) % 11
+        if r > 1:
+            r = 11 - r
+        else:
+            r = 0
+        if digitos[n + i] != r:
+            return False
+    return True
+
+
+def normaliza(token):
+    '''
+    Valida o token (bytes ou memoryview) e retorna só os dígitos do CNPJ ou
+    CPF, ou None se for inválido.
+
+    >>> normaliza('11222333000182') is None
+    True
+    >>> normaliza('560.683.325/51') is None
+    True
+    '''
+
+    digitos, barra = _digitos(token)
+    if digitos is None:
+        return None
+
+    if len(digitos) == 14 and _verificadores(digitos, _PESOS_CNPJ):
+        pass
+    elif (len(digitos) == 11 and not barra
+          and _verificadores(digitos, _PESOS_CPF)
+          and digitos.count(digitos[0]) != 11):
+        pass
+    else:
+        return None
+
+    return ''.join([chr(_ZERO + d) for d in digitos])
+
+
+def validos(tokens):
+    '''Filtra os tokens, gerando apenas os CNPJs e CPFs válidos normalizados'''
+    for token in tokens:
+        documento = normaliza(token)
+        if documento is not None:
+            yield documento
+
+
+def delimitador(opcao):
+    '''
+    Converte o valor de uma opção -d para o delimitador de tokens().
+
+    >>> delimitador(';'), delimitador('tab')
+    (';', '\\t')
+    '''
+    if opcao == 'tab':
+        return '\t'
+    if len(opcao) != 1:
+        raise ValueError('Delimitador inválido: %r' % opcao)
+    return opcao
+
+
+def formata(documento):
+    '''Formata um documento normalizado como str(Cnpj) ou str(Cpf)'''
+    if len(documento) == 14:
+        return '%s.%s.%s/%s-%s' % (documento[:2], documento[2:5],
+                                   documento[5:8], documento[8:12],
+                                   documento[12:])
+    return '%s.%s.%s-%s' % (documento[:3], documento[3:6], documento[6:9],
+                            documento[9:])
+
+
+if __name__ == "__main__":
+    import doctest
+    doctest.testmod()
+
+
+# vim:tabstop=4:expandtab:smartindent:encoding=utf8
@@ -0,0 +1,62 @@
+#!/usr/bin/env python
+# coding: utf8
+#
+# (c) Copyright 2009 by Narcelio Filho <narcelio@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+'''
+Lê CNPJs e CPFs da linha de comando (ou da entrada padrão, se nenhum for
+informado) e escreve um CSV na saída com as doações das campanhas de 2004, 2006
+e 2008, consultadas ao mesmo tempo. O tempo de cada consulta vai para a saída
+de erros.
+
+Cada opção -i ano:indice.idx faz as consultas daquele ano passarem antes pelo
+índice de doadores conhecidos (veja tse/indice.py).
+
+uso: perfil_doador.py [-i ano:indice.idx]... [CNPJ ou CPF]... > perfil.csv
+'''
+
+import sys
+from csv import writer as csv_writer
+from getopt import GetoptError
+from getopt import getopt
+
+from tse.prestacao_de_contas import perfil_doador
+from tse.prestacao_de_contas import usa_indices
+
+if __name__ == '__main__':
+    try:
+        opcoes, argumentos = getopt(sys.argv[1:], 'i:')
+        usa_indices(valor for opcao, valor in opcoes)
+    except (GetoptError, ValueError, IOError), e:
+        print >>sys.stderr, '%s\n%s' % (e, __doc__.strip().split('\n')[-1])
+        sys.exit(1)
+
+    csv = csv_writer(sys.stdout)
+    csv.writerow(perfil_doador.campos + ['CNPJ ou CPF'])
+
+    documentos = argumentos or (line.strip() for line in sys.stdin)
+    for cnpj_ou_cpf in documentos:
+        tabela, tempos = perfil_doador(cnpj_ou_cpf)
+        sys.stderr.write('%s: %s, total %.2fs\n' % (cnpj_ou_cpf,
+            ', '.join('%d %.2fs' % item for item in sorted(tempos.items())),
+            max(tempos.values())))
+        csv.writerows([string.encode('utf8')
+                        for string in linha + [cnpj_ou_cpf]]
+                            for linha in tabela)
+
+
+# vim:tabstop=4:expandtab:smartindent:encoding=utf8
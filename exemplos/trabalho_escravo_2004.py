@@ -20,14 +20,21 @@
 '''
 Lê CNPJs e CPFs na entrada padrão e escreve um CSV na saída com o resultado da
 consulta da prestação de contas da campanha de 2006.
+
+uso: trabalho_escravo_2004.py [indice.idx] < documentos
 '''
 
 import sys
 from csv import writer as csv_writer
 
 from tse.prestacao_de_contas import doador_2004
+from tse.prestacao_de_contas import usa_indice
 
 if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        # índice de doadores conhecidos, veja tse/indice.py
+        usa_indice(2004, sys.argv[1])
+
     csv = csv_writer(sys.stdout)
     csv.writerow(doador_2004.campos + ['CNPJ ou CPF'])
 
@@ -41,8 +48,6 @@ if __name__ == '__main__':
                      for string in linha + [cnpj_ou_cpf]]
                         for linha in tabela]
             csv.writerows(rows)
-        else:
-            #sys.stderr.write('NOT FOUND\n')
 
 
 # vim:tabstop=4:expandtab:smartindent:encoding=utf8
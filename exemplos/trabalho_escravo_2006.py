@@ -20,14 +20,21 @@
 '''
 Lê CNPJs e CPFs na entrada padrão e escreve um CSV na saída com o resultado da
 consulta da prestação de contas da campanha de 2006.
+
+uso: trabalho_escravo_2006.py [indice.idx] < documentos
 '''
 
 import sys
 from csv import writer as csv_writer
 
 from tse.prestacao_de_contas import doador_2006
+from tse.prestacao_de_contas import usa_indice
 
 if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        # índice de doadores conhecidos, veja tse/indice.py
+        usa_indice(2006, sys.argv[1])
+
     csv = csv_writer(sys.stdout)
     csv.writerow(doador_2006.campos + ['CNPJ ou CPF'])
 
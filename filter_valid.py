@@ -5,6 +5,12 @@
 #
 # Filtra só CNPJs ou CPFs válidos na entrada padrão
 #
+# uso: filter_valid.py [-d delimitador] [arquivo [coluna]]
+#
+# Se um arquivo for informado, ele é mapeado em memória e, se houver também
+# uma coluna (número a partir de 0 ou nome no cabeçalho), é lido como CSV,
+# separado por vírgulas ou pelo delimitador informado ("-d ';'", "-d tab").
+#
 # (c) Copyright 2009 by Narcelio Filho <narcelio@gmail.com>
 #
 # This program is free software: you can redistribute it and/or modify
@@ -22,10 +28,40 @@
 #
 
 import sys
+from getopt import GetoptError
+from getopt import getopt
+
+import entrada
+from tse.pessoa import pessoa_or_valueerror
 
-from tse.prestacao_de_contas import pessoa_or_valueerror
+USO = 'uso: filter_valid.py [-d delimitador] [arquivo [coluna]]'
 
 if __name__ == '__main__':
+    try:
+        opcoes, argumentos = getopt(sys.argv[1:], 'd:')
+        delimitador = entrada.delimitador(dict(opcoes).get('-d', ','))
+    except (GetoptError, ValueError), e:
+        print >>sys.stderr, '%s\n%s' % (e, USO)
+        sys.exit(1)
+    if len(argumentos) > 2:
+        print >>sys.stderr, USO
+        sys.exit(1)
+
+    if argumentos:
+        coluna = None
+        if len(argumentos) > 1:
+            coluna = argumentos[1]
+            if coluna.isdigit():
+                coluna = int(coluna)
+        try:
+            for documento in entrada.validos(
+                    entrada.tokens(argumentos[0], coluna, delimitador)):
+                print entrada.formata(documento)
+        except ValueError, e:
+            print >>sys.stderr, '%s\n%s' % (e, USO)
+            sys.exit(1)
+        sys.exit(0)
+
     for line in sys.stdin.readlines():
         for part in line.split():
             try:
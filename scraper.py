@@ -22,10 +22,68 @@
 #
 
 import logging
-import mechanize
+import threading
 
-from BeautifulSoup import BeautifulSoup
-from BeautifulSoup import BeautifulStoneSoup
+# mechanize e BeautifulSoup demoram para importar e só são necessários quando
+# há acesso à rede, então são carregados em carrega_dependencias()
+mechanize = None
+BeautifulSoup = None
+BeautifulStoneSoup = None
+
+
+def carrega_dependencias():
+    '''Importa mechanize e BeautifulSoup na primeira vez em que são usados'''
+    global mechanize, BeautifulSoup, BeautifulStoneSoup
+    if mechanize is None:
+        from BeautifulSoup import BeautifulSoup
+        from BeautifulSoup import BeautifulStoneSoup
+        import mechanize
+
+
+# handler e arquivo usados pelos novos Scrapers, veja usa_arquivo()
+_transporte = None
+
+
+def usa_arquivo(caminho, reproduz=False):
+    '''Faz os próximos Scrapers gravarem todas as requisições e respostas no
+    arquivo em caminho, ou, com reproduz=True, responderem a partir dele sem
+    acessar a rede (veja transporte.py). Com caminho None volta ao normal.'''
+    global _transporte
+    if caminho is None:
+        _transporte = None
+        return
+
+    carrega_dependencias()
+    from transporte import Arquivo, Gravador, Reprodutor
+    handler = reproduz and Reprodutor or Gravador
+    _transporte = handler, Arquivo(caminho)
+
+
+# Scraper de cada thread, guardado para a próxima consulta, veja novo_scraper()
+_reutiliza = False
+_reservados = threading.local()
+
+
+def reutiliza_scrapers(ativo=True):
+    '''Faz novo_scraper() reaproveitar, em cada thread, o Scraper da consulta
+    anterior em vez de criar outro. Útil para threads que fazem muitas
+    consultas, como as do servico.py.'''
+    global _reutiliza
+    _reutiliza = ativo
+
+
+def novo_scraper(contexto=None):
+    '''Retorna um Scraper sem cookies nem histórico para a consulta
+    identificada por contexto (veja Scraper)'''
+    if not _reutiliza:
+        return Scraper(contexto)
+    scraper = getattr(_reservados, 'scraper', None)
+    # um Scraper criado antes de usa_arquivo() não tem o handler novo
+    if scraper is None or scraper.transporte is not _transporte:
+        scraper = _reservados.scraper = Scraper(contexto)
+    else:
+        scraper.reinicia(contexto)
+    return scraper
 
 
 class Scraper(object):
@@ -42,9 +100,33 @@ class Scraper(object):
     <!DOCTYPE HTML PUBLIC "-//W3C//DTD HTML 4.01 Transitional//EN"
     '''
 
-    def __init__(self):
+    def __init__(self, contexto=None):
+        '''contexto identifica a consulta, como (ano, documento), para que
+        usa_arquivo() grave e reproduza cada consulta separadamente'''
+        carrega_dependencias()
         logging.info('Creating browser')
         self.browser = self._create_browser()
+        self.conteudo = self.cabecalhos = self._html = None
+        self.nao_modificado = False
+        self.transporte = _transporte
+        self._handler = None
+        if _transporte is not None:
+            handler, arquivo = _transporte
+            self._handler = handler(arquivo, contexto)
+            self.browser.add_handler(self._handler)
+
+
+    def reinicia(self, contexto=None):
+        '''Prepara o Scraper para uma nova consulta, descartando cookies,
+        histórico e a última resposta, mas mantendo o browser'''
+        self.browser.clear_history()
+        self.browser.request = None
+        self.browser._set_response(None, True)
+        self.browser.set_cookiejar(mechanize.CookieJar())
+        self.conteudo = self.cabecalhos = self._html = None
+        self.nao_modificado = False
+        if self._handler is not None:
+            self._handler.reinicia(contexto)
 
 
     def _create_browser(self):
@@ -67,34 +149,65 @@ class Scraper(object):
         return browser
 
 
-    def open(self, url):
+    def open(self, url, cabecalhos=None):
         '''Abre a url do parâmetro, seleciona o primeiro form caso haja algum e
-        cria o atributo self.html com o BeautifulSoup()'''
+        guarda a resposta (veja _le_resposta()). cabecalhos é um dicionário
+        com cabeçalhos extras para esta requisição, como If-None-Match.'''
 
         logging.info('Opening URL ' + url)
-        self.browser.open(url)
-        try:
-            self.browser.select_form(nr=0)
-        except mechanize._mechanize.FormNotFoundError:
-            pass
-        self.html = BeautifulSoup(self.browser.response().read())
-        self.browser.response().seek(0)
+        if cabecalhos:
+            url = mechanize.Request(url, headers=cabecalhos)
+        self._abre(url)
 
 
-    def submit(self, **kw):
+    def submit(self, cabecalhos=None, **kw):
         '''Faz o submit no form selecionado'''
         logging.info('Submitting form')
-        self.browser.submit(**kw)
+        requisicao = self.browser.click(**kw)
+        for nome, valor in (cabecalhos or {}).items():
+            requisicao.add_header(nome, valor)
+        self._abre(requisicao)
+
+
+    def _abre(self, requisicao):
+        try:
+            self.browser.open(requisicao)
+        except mechanize.HTTPError, e:
+            if e.code != 304:
+                raise
+            # resposta a um pedido condicional: nada mudou desde a última vez
+            self.nao_modificado = True
+            self.conteudo = self.cabecalhos = self._html = None
+            return
+        self._le_resposta()
+
+
+    def _le_resposta(self):
+        '''Guarda o conteúdo e os cabeçalhos da resposta em self.conteudo e
+        self.cabecalhos. O BeautifulSoup em self.html só é criado quando
+        for usado.'''
         try:
             self.browser.select_form(nr=0)
         except mechanize._mechanize.FormNotFoundError:
             pass
-        self.html = BeautifulSoup(self.browser.response().read())
-        self.browser.response().seek(0)
+        resposta = self.browser.response()
+        self.conteudo = resposta.read()
+        self.cabecalhos = resposta.info()
+        self.nao_modificado = False
+        self._html = None
+        resposta.seek(0)
+
+
+    @property
+    def html(self):
+        if self._html is None:
+            self._html = BeautifulSoup(self.conteudo)
+        return self._html
 
 
 def html2unicode(s):
     '''Converte uma string com entidades HTML para unicode'''
+    carrega_dependencias()
     n = BeautifulStoneSoup(s, convertEntities=BeautifulStoneSoup.HTML_ENTITIES)
     return unicode(n)
 
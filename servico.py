@@ -0,0 +1,353 @@
+#!/usr/bin/env python
+# coding: utf8
+#
+# servico.py
+#
+# Serviço HTTP residente para validação de CNPJs e CPFs e consulta de doadores
+#
+# (c) Copyright 2009 by Narcelio Filho <narcelio@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+'''
+uso: servico.py [-i ano:indice.idx]... [endereco:]porta
+
+Rotas (as respostas são JSON):
+
+    GET /valida?doc=...&doc=...  documento formatado, ou null se inválido
+    GET /doador/<ano>/<doc>      linhas com os campos de perfil_doador.campos
+
+As validações entram numa fila limitada e são processadas em pequenos lotes
+numa thread; cada pedido entra inteiro na fila, e um pedido com mais documentos
+do que cabem num lote é recusado com 413. As consultas ao TSE entram noutra fila e cada uma é feita por uma
+das threads de consulta, que reaproveitam seus Scrapers; pedidos iguais que
+chegam enquanto uma consulta está em andamento esperam por ela em vez de
+consultar de novo, e os resultados ficam num cache LRU. Se uma fila estiver
+cheia, a resposta é 503 com Retry-After, para que o cliente espere em vez de
+acumular pedidos.
+
+Com -i, as consultas do ano passam antes pelo índice de doadores conhecidos
+(veja tse/indice.py), e documentos fora dele são respondidos sem acessar o TSE.
+'''
+
+import json
+import logging
+import sys
+from BaseHTTPServer import BaseHTTPRequestHandler
+from BaseHTTPServer import HTTPServer
+from Queue import Empty
+from Queue import Full
+from Queue import Queue
+from SocketServer import ThreadingMixIn
+from threading import Event
+from threading import Lock
+from threading import Thread
+from time import time
+from urlparse import parse_qs
+from urlparse import urlparse
+
+import entrada
+from cache import Cache
+
+
+class _Pedido(object):
+    __slots__ = ('item', 'resultado', 'erro', 'pronto')
+
+    def __init__(self, item):
+        self.item = item
+        self.resultado = self.erro = None
+        self.pronto = Event()
+
+
+class Lote(object):
+    '''
+    Junta pedidos numa fila limitada e os entrega em lotes de até "tamanho"
+    itens a processa(itens), que deve retornar a lista de resultados na mesma
+    ordem (um resultado que seja uma exceção é levantado para quem fez o
+    pedido). Um lote é fechado quando fica cheio ou "espera" segundos depois do
+    seu primeiro pedido.
+
+    Cada pedido ocupa um único lugar na fila e vai inteiro para um só lote,
+    então um pedido com mais de "tamanho" itens é recusado com ValueError:
+
+    >>> lote = Lote(lambda itens: [len(itens)] * len(itens), tamanho=3)
+    >>> lote.executa(['a', 'b', 'c'])
+    [3, 3, 3]
+    >>> lote.executa(['a', 'b', 'c', 'd'])
+    Traceback (most recent call last):
+    ...
+    ValueError: Pedido com 4 itens, o máximo é 3
+    '''
+
+    def __init__(self, processa, tamanho=100, espera=0.005, limite=1000,
+                 threads=1):
+        self.processa = processa
+        self.tamanho = tamanho
+        self.espera = espera
+        self._fila = Queue(limite)
+        for _ in xrange(threads):
+            thread = Thread(target=self._trabalha)
+            thread.daemon = True
+            thread.start()
+
+
+    def executa(self, itens):
+        '''Processa os itens junto com os de outros pedidos e retorna seus
+        resultados. Levanta Queue.Full se a fila estiver cheia, e ValueError
+        se houver mais itens do que cabem num lote.'''
+        itens = list(itens)
+        if len(itens) > self.tamanho:
+            raise ValueError('Pedido com %d itens, o máximo é %d'
+                             % (len(itens), self.tamanho))
+        if not itens:
+            return []
+
+        pedido = _Pedido(itens)
+        self._fila.put_nowait(pedido)
+        # sem timeout, wait() não é interrompido por KeyboardInterrupt
+        pedido.pronto.wait(1e9)
+        if pedido.erro is not None:
+            raise pedido.erro
+        return pedido.resultado
+
+
+    def _trabalha(self):
+        # pedido que já saiu da fila mas não coube no lote anterior
+        proximo = None
+        while True:
+            pedidos = [proximo or self._fila.get()]
+            proximo = None
+            quantidade = len(pedidos[0].item)
+            limite = time() + self.espera
+            while quantidade < self.tamanho:
+                restante = limite - time()
+                if restante <= 0:
+                    break
+                try:
+                    pedido = self._fila.get(timeout=restante)
+                except Empty:
+                    break
+                if quantidade + len(pedido.item) > self.tamanho:
+                    proximo = pedido
+                    break
+                pedidos.append(pedido)
+                quantidade += len(pedido.item)
+
+            try:
+                resultados = self.processa([item for pedido in pedidos
+                                            for item in pedido.item])
+            except Exception, e:
+                logging.exception('Erro processando lote')
+                for pedido in pedidos:
+                    pedido.erro = e
+            else:
+                inicio = 0
+                for pedido in pedidos:
+                    fim = inicio + len(pedido.item)
+                    pedido.resultado = resultados[inicio:fim]
+                    for resultado in pedido.resultado:
+                        if isinstance(resultado, Exception):
+                            pedido.erro = resultado
+                            break
+                    inicio = fim
+            for pedido in pedidos:
+                pedido.pronto.set()
+
+
+def valida(documentos):
+    '''Valida um lote de documentos, retornando-os formatados ou None'''
+    resultados = []
+    for documento in documentos:
+        documento = entrada.normaliza(documento)
+        if documento is not None:
+            documento = entrada.formata(documento)
+        resultados.append(documento)
+    return resultados
+
+
+class Consultas(object):
+    '''
+    Consulta (ano, documento) com cache. Cada consulta distinta é feita
+    sozinha por uma das threads, e pedidos iguais a uma consulta em andamento
+    esperam o resultado dela.
+
+    >>> feitas = []
+    >>> def consulta(ano, documento):
+    ...     feitas.append(documento)
+    ...     return [[documento]]
+    >>> consultas = Consultas(consulta=consulta)
+    >>> consultas.executa(2006, '56068332551')
+    [['56068332551']]
+    >>> consultas.executa(2006, '56068332551'), feitas
+    ([['56068332551']], ['56068332551'])
+    '''
+
+    def __init__(self, threads=8, limite=1000, tamanho_cache=100000,
+                 validade=24 * 3600, consulta=None):
+        self.cache = Cache(tamanho_cache, validade)
+        self.consulta = consulta or self._consulta_no_tse
+        self._lote = Lote(self._processa, tamanho=1, limite=limite,
+                          threads=threads)
+        self._em_andamento = {}
+        self._trava = Lock()
+
+
+    def executa(self, ano, documento):
+        '''Retorna as linhas de perfil_doador.campos do documento no ano.
+        Levanta Queue.Full se a fila estiver cheia.'''
+        chave = ano, documento
+        tabela = self.cache.busca(chave)
+        if tabela is not Cache.AUSENTE:
+            return tabela
+
+        with self._trava:
+            pedido = self._em_andamento.get(chave)
+            primeiro = pedido is None
+            if primeiro:
+                pedido = self._em_andamento[chave] = _Pedido(chave)
+
+        if primeiro:
+            try:
+                pedido.resultado, = self._lote.executa([chave])
+            except Exception, e:
+                pedido.erro = e
+            with self._trava:
+                del self._em_andamento[chave]
+            pedido.pronto.set()
+        else:
+            pedido.pronto.wait(1e9)
+
+        if pedido.erro is not None:
+            raise pedido.erro
+        return pedido.resultado
+
+
+    def _processa(self, pedidos):
+        (ano, documento), = pedidos
+        try:
+            tabela = self.consulta(ano, documento)
+        except Exception, e:
+            logging.exception('Erro consultando %s em %d' % (documento, ano))
+            return [e]
+        self.cache.guarda((ano, documento), tabela)
+        return [tabela]
+
+
+    @staticmethod
+    def _consulta_no_tse(ano, documento):
+        from tse.prestacao_de_contas import consulta_doador
+        from tse.prestacao_de_contas import normaliza
+
+        # consulta_doador levanta a falha em vez de retornar None, para que
+        # ela não fique no cache como uma tabela vazia
+        return normaliza(ano, consulta_doador(ano, documento))
+
+
+class Manipulador(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # cabeçalhos e corpo num só envio; escritas separadas esbarram no
+    # algoritmo de Nagle e no ACK atrasado das conexões persistentes
+    wbufsize = -1
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        partes = url.path.strip('/').split('/')
+        try:
+            if partes == ['valida']:
+                documentos = parse_qs(url.query).get('doc', [])
+                if len(documentos) > self.server.validacao.tamanho:
+                    return self._responde(413, {'erro': 'documentos demais'})
+                resposta = dict(zip(documentos,
+                    self.server.validacao.executa(documentos)))
+            elif len(partes) == 3 and partes[0] == 'doador':
+                from tse.prestacao_de_contas import etapas
+
+                ano, documento = int(partes[1]), entrada.normaliza(partes[2])
+                if ano not in etapas:
+                    return self._responde(400, {'erro': 'ano sem consulta'})
+                if documento is None:
+                    return self._responde(400, {'erro': 'CNPJ/CPF inválido'})
+                resposta = self.server.consultas.executa(ano, documento)
+            else:
+                return self._responde(404, {'erro': 'rota desconhecida'})
+        except Full:
+            return self._responde(503, {'erro': 'serviço ocupado'},
+                                  [('Retry-After', '1')])
+        except (ValueError, KeyError):
+            return self._responde(400, {'erro': 'pedido inválido'})
+        except Exception, e:
+            return self._responde(502, {'erro': str(e)})
+        self._responde(200, resposta)
+
+
+    def _responde(self, codigo, dados, cabecalhos=()):
+        corpo = json.dumps(dados)
+        self.send_response(codigo)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(corpo)))
+        for nome, valor in cabecalhos:
+            self.send_header(nome, valor)
+        self.end_headers()
+        self.wfile.write(corpo)
+
+
+    def log_message(self, formato, *args):
+        logging.debug(formato % args)
+
+
+class Servico(ThreadingMixIn, HTTPServer):
+    '''Servidor HTTP com o lote de validação e as threads de consulta'''
+
+    daemon_threads = True
+    allow_reuse_address = True
+    request_queue_size = 128
+
+    def __init__(self, endereco, threads_consulta=8, limite=1000):
+        HTTPServer.__init__(self, endereco, Manipulador)
+        self.validacao = Lote(valida, tamanho=1000, limite=limite)
+        self.consultas = Consultas(threads_consulta, limite)
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+
+    from getopt import GetoptError
+    from getopt import getopt
+
+    from tse.prestacao_de_contas import usa_indices
+
+    try:
+        opcoes, argumentos = getopt(sys.argv[1:], 'i:')
+        usa_indices(valor for opcao, valor in opcoes)
+    except (GetoptError, ValueError, IOError), e:
+        print >>sys.stderr, e
+        argumentos = []
+    if len(argumentos) != 1:
+        print __doc__.split('\n\n')[0].strip()
+        sys.exit(1)
+
+    from scraper import reutiliza_scrapers
+    reutiliza_scrapers()
+
+    endereco, _, porta = argumentos[0].rpartition(':')
+    servico = Servico((endereco or '127.0.0.1', int(porta)))
+    logging.info('Atendendo em %s:%d' % servico.server_address)
+    try:
+        servico.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+# vim:tabstop=4:expandtab:smartindent:encoding=utf8
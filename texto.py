@@ -0,0 +1,181 @@
+#!/usr/bin/env python
+# coding: utf8
+#
+# texto.py
+#
+# Decodificação rápida das entidades HTML das células extraídas do TSE
+#
+# (c) Copyright 2009 by Narcelio Filho <narcelio@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+'''
+decodifica() tem o mesmo resultado de scraper.html2unicode(), que monta uma
+BeautifulStoneSoup para cada célula, mas resolve as entidades com uma tabela
+pré-calculada e uma expressão regular. Como html2unicode(), ela devolve "&",
+"<" e ">" escapados quando não parecem parte de uma entidade:
+
+>>> decodifica(u'S&atilde;o Jos&#233; &amp; Cia')
+u'S\\xe3o Jos\\xe9 &amp; Cia'
+>>> decodifica(u'JOS&Eacute; &gt; 1')
+u'JOS\\xc9 &gt; 1'
+>>> decodifica(u'   ')
+u' '
+
+Textos que a expressão não cobre por inteiro (marcação, entidades sem ";" ou
+desconhecidas, "&" soltos, str com bytes fora do ASCII) ficam com a própria
+html2unicode(), para que o resultado continue idêntico:
+
+>>> decodifica(u'AT&T')
+u'AT'
+
+Os valores decodificados ficam num cache LRU limitado, já que nomes, partidos
+e datas se repetem muito. decodifica_coluna() e decodifica_tabela() tratam
+listas inteiras, decodificando cada valor distinto uma única vez:
+
+>>> decodifica_coluna([u'Jo&atilde;o', u'PT', u'Jo&atilde;o'])
+[u'Jo\\xe3o', u'PT', u'Jo\\xe3o']
+'''
+
+from htmlentitydefs import name2codepoint
+from re import compile as regexp
+
+from cache import Cache
+
+
+TAMANHO_CACHE = 50000
+
+# entidades bem formadas, no mesmo formato aceito pelo sgmllib
+_ENTIDADE = regexp(r'&(?:#([0-9]+)|([a-zA-Z][a-zA-Z0-9]*));')
+
+# o que o BeautifulSoup escapa ao converter o texto de volta para unicode
+_SOLTO = regexp(r'([<>]|&(?!#\d+;|#x[0-9a-fA-F]+;|\w+;))')
+_ESCAPES = {u'&': u'&amp;', u'<': u'&lt;', u'>': u'&gt;'}
+
+_ENTIDADES = dict((nome, unichr(codigo))
+                  for nome, codigo in name2codepoint.iteritems())
+
+# espaços que o BeautifulSoup considera ao juntar textos vazios
+_ESPACOS = dict.fromkeys(map(ord, u'\t\n\x0c\r '))
+
+
+class _Diferente(Exception):
+    '''O texto precisa de html2unicode()'''
+
+
+def _entidade(m):
+    numero, nome = m.groups()
+    if nome is not None:
+        try:
+            return _ENTIDADES[nome]
+        except KeyError:
+            raise _Diferente
+    try:
+        return unichr(int(numero))
+    except (ValueError, OverflowError):
+        raise _Diferente
+
+
+def _escape(m):
+    return _ESCAPES[m.group(1)]
+
+
+def _decodifica(s):
+    '''Decodifica s sem cache, igual a html2unicode()'''
+    if isinstance(s, str):
+        try:
+            s = s.decode('ascii')
+        except UnicodeDecodeError:
+            return _html2unicode(s)
+
+    if u'<' in s:
+        return _html2unicode(s)
+
+    if u'&' in s:
+        if s.count(u'&') != len(_ENTIDADE.findall(s)):
+            return _html2unicode(s)
+        try:
+            s = _ENTIDADE.sub(_entidade, s)
+        except _Diferente:
+            return _html2unicode(s)
+
+    if s and not s.translate(_ESPACOS):
+        if u'\n' in s:
+            return u'\n'
+        return u' '
+    return _SOLTO.sub(_escape, s)
+
+
+def _html2unicode(s):
+    from scraper import html2unicode
+    return html2unicode(s)
+
+
+_cache = Cache(TAMANHO_CACHE)
+
+
+def decodifica(s):
+    '''Converte uma string com entidades HTML para unicode, como
+    scraper.html2unicode()'''
+    # texto sem entidades nem sinais a escapar não precisa de cache
+    if not ('&' in s or '<' in s or '>' in s) and s.strip():
+        if isinstance(s, unicode):
+            return unicode(s)
+        try:
+            return s.decode('ascii')
+        except UnicodeDecodeError:
+            pass
+    resultado = _cache.busca(s)
+    if resultado is Cache.AUSENTE:
+        resultado = _decodifica(s)
+        _cache.guarda(s, resultado)
+    return resultado
+
+
+def decodifica_coluna(valores):
+    '''Decodifica uma lista de valores, cada valor distinto uma única vez'''
+    vistos = {}
+    resultado = []
+    for valor in valores:
+        try:
+            texto = vistos[valor]
+        except KeyError:
+            texto = vistos[valor] = decodifica(valor)
+        resultado.append(texto)
+    return resultado
+
+
+def decodifica_tabela(linhas):
+    '''Decodifica todas as células de uma lista de linhas'''
+    vistos = {}
+    tabela = []
+    for linha in linhas:
+        colunas = []
+        for valor in linha:
+            try:
+                texto = vistos[valor]
+            except KeyError:
+                texto = vistos[valor] = decodifica(valor)
+            colunas.append(texto)
+        tabela.append(colunas)
+    return tabela
+
+
+if __name__ == "__main__":
+    import doctest
+    doctest.testmod()
+
+
+# vim:tabstop=4:expandtab:smartindent:encoding=utf8
@@ -0,0 +1,248 @@
+#!/usr/bin/env python
+# coding: utf8
+#
+# transporte.py
+#
+# Gravação e reprodução das requisições HTTP feitas pelo Scraper
+#
+# (c) Copyright 2009 by Narcelio Filho <narcelio@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+'''
+O Gravador e o Reprodutor são handlers do mechanize. Eles ficam antes do
+tratamento de gzip, então o arquivo guarda a resposta exatamente como veio do
+servidor. Cada par requisição/resposta é indexado pelo método, URL e corpo da
+requisição e os dados são comprimidos com zlib numa base SQLite. Na reprodução
+nenhum acesso à rede é feito: uma requisição que não está no arquivo gera
+URLError.
+
+As consultas do TSE dependem da sessão: a mesma URL, sem corpo, devolve o
+resultado do último documento pesquisado naquela sessão, e o ViewState e o
+jsessionid mudam a cada acesso. Por isso cada handler pode receber um
+contexto, como (ano, documento), e então a chave passa a ser o contexto, a
+posição da requisição na consulta, o método, a URL e o corpo, estes dois sem o
+ViewState e o jsessionid:
+
+>>> class Servidor(mechanize.BaseHandler):
+...     handler_order = 400
+...     def http_open(self, requisicao):
+...         if requisicao.has_data():
+...             self.documento = requisicao.get_data().split('=')[1]
+...         conteudo = 'doacoes de %s' % self.documento
+...         return _resposta(conteudo, [], requisicao.get_full_url(), 200, 'OK')
+>>> def consulta(documento, *handlers):
+...     navegador = mechanize.build_opener(*handlers)
+...     navegador.open('http://tse/consulta', 'cdCpfCgc=%s' % documento)
+...     return navegador.open('http://tse/resultado').read()
+>>> arquivo, servidor = Arquivo(':memory:'), Servidor()
+>>> for documento in ('05323733000180', '56068332551'):
+...     consulta(documento, servidor, Gravador(arquivo, (2008, documento)))
+'doacoes de 05323733000180'
+'doacoes de 56068332551'
+>>> for documento in ('05323733000180', '56068332551'):
+...     consulta(documento, Reprodutor(arquivo, (2008, documento)))
+'doacoes de 05323733000180'
+'doacoes de 56068332551'
+
+Normalmente são usados através de scraper.usa_arquivo().
+'''
+
+import sqlite3
+import zlib
+from StringIO import StringIO
+from hashlib import sha1
+from marshal import dumps
+from marshal import loads
+from re import compile as regexp
+from threading import Lock
+
+import mechanize
+from mechanize._response import closeable_response
+from mechanize._response import make_headers
+
+
+_ESQUEMA = '''
+CREATE TABLE IF NOT EXISTS respostas (
+    chave TEXT PRIMARY KEY,
+    url TEXT NOT NULL,
+    dados BLOB NOT NULL
+);
+'''
+
+
+# valores da sessão JSF que mudam a cada acesso, na URL e nos formulários
+_VOLATIL = regexp(r'(?i)(;jsessionid=|ViewState=)[^&?#]*')
+
+
+def chave(requisicao, contexto=None):
+    '''Identifica a requisição pelo método, URL e corpo e, se houver, pelo
+    contexto (por exemplo, ano, documento e posição na consulta)
+
+    >>> a = mechanize.Request('http://tse/a.jsp;jsessionid=X1', 'javax.faces.ViewState=j1&d=1')
+    >>> b = mechanize.Request('http://tse/a.jsp;jsessionid=Y2', 'javax.faces.ViewState=j2&d=1')
+    >>> chave(a, (2006, '1', 2)) == chave(b, (2006, '1', 2)), chave(a) == chave(b)
+    (True, False)
+    '''
+    partes = [requisicao.get_method(), requisicao.get_full_url(),
+              requisicao.get_data() or '']
+    if contexto is not None:
+        partes = [repr(contexto)] + [_VOLATIL.sub(r'\1', parte)
+                                     for parte in partes]
+    return sha1('\0'.join(partes)).hexdigest()
+
+
+class Arquivo(object):
+    '''
+    Arquivo de respostas HTTP. Pode ser compartilhado entre threads.
+
+    >>> arquivo = Arquivo(':memory:')
+    >>> requisicao = mechanize.Request('http://www.tse.gov.br/', data='a=1')
+    >>> arquivo.grava(requisicao, 200, 'OK', [('Content-Type', 'text/html')], '<html>')
+    >>> arquivo.busca(requisicao)
+    (200, 'OK', [('Content-Type', 'text/html')], '<html>')
+    >>> arquivo.busca(mechanize.Request('http://www.tse.gov.br/')) is None
+    True
+    >>> len(arquivo)
+    1
+    '''
+
+    def __init__(self, caminho):
+        self._conexao = sqlite3.connect(caminho, isolation_level=None,
+                                        check_same_thread=False)
+        self._conexao.executescript(_ESQUEMA)
+        self._trava = Lock()
+
+
+    def grava(self, requisicao, codigo, mensagem, cabecalhos, conteudo,
+              contexto=None):
+        '''Grava a resposta, junto com a requisição que a gerou'''
+        dados = zlib.compress(dumps((
+            requisicao.get_method(),
+            requisicao.get_full_url(),
+            requisicao.get_data(),
+            requisicao.header_items(),
+            codigo, mensagem, cabecalhos, conteudo,
+        )))
+        with self._trava:
+            self._conexao.execute(
+                'INSERT OR REPLACE INTO respostas VALUES (?, ?, ?)',
+                (chave(requisicao, contexto), requisicao.get_full_url(),
+                 sqlite3.Binary(dados)))
+
+
+    def busca(self, requisicao, contexto=None):
+        '''Retorna (codigo, mensagem, cabecalhos, conteudo) da resposta
+        gravada para a requisição, ou None'''
+        with self._trava:
+            linha = self._conexao.execute(
+                'SELECT dados FROM respostas WHERE chave = ?',
+                (chave(requisicao, contexto),)).fetchone()
+        if linha is None:
+            return None
+        return loads(zlib.decompress(linha[0]))[4:]
+
+
+    def __len__(self):
+        with self._trava:
+            return self._conexao.execute(
+                'SELECT COUNT(*) FROM respostas').fetchone()[0]
+
+
+    def close(self):
+        self._conexao.close()
+
+
+def _cabecalhos(info):
+    '''Lista de (nome, valor) preservando cabeçalhos repetidos, como
+    Set-Cookie'''
+    cabecalhos = []
+    for linha in info.headers:
+        if ':' in linha:
+            nome, valor = linha.split(':', 1)
+            cabecalhos.append((nome.strip(), valor.strip()))
+    return cabecalhos
+
+
+def _resposta(conteudo, cabecalhos, url, codigo, mensagem):
+    # como a resposta do HTTPHandler, sem seek(); mechanize.make_response()
+    # devolve uma resposta com seek() e o Browser passaria a ler o conteúdo
+    # ainda comprimido, ignorando o HTTPGzipProcessor
+    return closeable_response(StringIO(conteudo), make_headers(cabecalhos),
+                              url, codigo, mensagem)
+
+
+class _Handler(mechanize.BaseHandler):
+
+    def __init__(self, arquivo, contexto=None):
+        self.arquivo = arquivo
+        self.reinicia(contexto)
+
+
+    def reinicia(self, contexto=None):
+        '''Passa a gravar ou reproduzir uma nova consulta'''
+        self.contexto = contexto
+        self._sequencia = 0
+
+
+    def _contexto(self):
+        '''Contexto da próxima requisição, com a sua posição na consulta'''
+        if self.contexto is None:
+            return None
+        self._sequencia += 1
+        return tuple(self.contexto) + (self._sequencia,)
+
+
+class Gravador(_Handler):
+    '''Grava no arquivo todas as respostas recebidas'''
+
+    # antes do HTTPGzipProcessor (200), para gravar o conteúdo comprimido
+    handler_order = 100
+
+    def http_response(self, requisicao, resposta):
+        conteudo = resposta.read()
+        cabecalhos = _cabecalhos(resposta.info())
+        self.arquivo.grava(requisicao, resposta.code, resposta.msg,
+                           cabecalhos, conteudo, self._contexto())
+        return _resposta(conteudo, cabecalhos, resposta.geturl(),
+                         resposta.code, resposta.msg)
+
+    https_response = http_response
+
+
+class Reprodutor(_Handler):
+    '''Responde as requisições com o conteúdo do arquivo, sem acessar a rede'''
+
+    # antes do HTTPHandler (500)
+    handler_order = 100
+
+    def http_open(self, requisicao):
+        resposta = self.arquivo.busca(requisicao, self._contexto())
+        if resposta is None:
+            raise mechanize.URLError('Resposta não gravada: %s %s' % (
+                requisicao.get_method(), requisicao.get_full_url()))
+        codigo, mensagem, cabecalhos, conteudo = resposta
+        return _resposta(conteudo, cabecalhos, requisicao.get_full_url(),
+                         codigo, mensagem)
+
+    https_open = http_open
+
+
+if __name__ == "__main__":
+    import doctest
+    doctest.testmod()
+
+
+# vim:tabstop=4:expandtab:smartindent:encoding=utf8
@@ -0,0 +1,245 @@
+#!/usr/bin/env python
+# coding: utf8
+#
+# Atualização incremental de doadores já consultados, emitindo só o que mudou
+#
+# (c) Copyright 2009 by Narcelio Filho <narcelio@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+'''
+uso: atualizacao.py base.db [ano]... < documentos > mudancas.csv
+
+Para cada (ano, documento) a base guarda um hash da página de resultado, o
+ETag e o Last-Modified recebidos e as linhas extraídas. Numa nova consulta, se
+o hash for o mesmo a página nem é analisada. Só quando o hash muda as linhas
+são extraídas de novo e comparadas com as anteriores.
+
+A consulta em si é sempre refeita: em 2004 e 2006 ela termina num POST, e só
+a última requisição de 2008 vai como pedido condicional, com os cabeçalhos
+guardados. O que se economiza é a análise das páginas que não mudaram.
+
+Uma consulta que falha (erro de rede, página inesperada) não é o mesmo que uma
+consulta sem resultados: a falha é registrada no log e as linhas guardadas
+ficam como estão, sem gerar mudanças. Pelo mesmo motivo, um documento que já
+tem linhas guardadas é consultado mesmo que o índice do ano diga que ele não é
+doador.
+
+As linhas seguem perfil_doador.campos. Uma linha que existia e não existe mais
+é "removida", uma nova é "adicionada" e uma que só mudou de valor ou tipo é
+"alterada":
+
+>>> antigas = [[u'2006', u'JOSE', u'', u'PT', u'SP', u'', u'', u'01/08/2006', u'10,00', u'A'],
+...            [u'2006', u'MARIA', u'', u'PT', u'SP', u'', u'', u'02/08/2006', u'5,00', u'A']]
+>>> novas = [[u'2006', u'JOSE', u'', u'PT', u'SP', u'', u'', u'01/08/2006', u'12,00', u'A'],
+...          [u'2006', u'ANA', u'', u'PV', u'RJ', u'', u'', u'03/08/2006', u'1,00', u'A']]
+>>> for tipo, antiga, nova in diferencas(antigas, novas):
+...     print tipo, (antiga or nova)[1]
+alterada JOSE
+removida MARIA
+adicionada ANA
+'''
+
+import json
+import logging
+import sqlite3
+import sys
+from hashlib import sha1
+from re import compile as regexp
+
+from tse.pessoa import pessoa_or_valueerror
+from tse.prestacao_de_contas import _talvez_doador
+from tse.prestacao_de_contas import etapas as etapas_do_tse
+from tse.prestacao_de_contas import normaliza
+
+
+_ESQUEMA = '''
+CREATE TABLE IF NOT EXISTS respostas (
+    ano INTEGER NOT NULL,
+    documento TEXT NOT NULL,
+    hash TEXT NOT NULL,
+    etag TEXT,
+    modificado TEXT,
+    linhas TEXT NOT NULL,
+    PRIMARY KEY (ano, documento)
+);
+'''
+
+# partes da página que mudam a cada acesso sem que o resultado mude
+_VOLATIL = regexp(r'(?i)<input[^>]*ViewState[^>]*>|jsessionid=[^"&?;]*')
+
+# campos que identificam uma doação; os demais (Valor e Tipo) podem mudar
+_CHAVE = slice(0, 8)
+
+
+def diferencas(antigas, novas):
+    '''Gera (tipo, linha antiga, linha nova) para cada linha alterada,
+    removida ou adicionada'''
+    restantes = list(novas)
+    removidas = []
+    for linha in antigas:
+        try:
+            restantes.remove(linha)
+        except ValueError:
+            removidas.append(linha)
+
+    for antiga in removidas:
+        for nova in restantes:
+            if nova[_CHAVE] == antiga[_CHAVE]:
+                restantes.remove(nova)
+                yield 'alterada', antiga, nova
+                break
+        else:
+            yield 'removida', antiga, None
+
+    for nova in restantes:
+        yield 'adicionada', None, nova
+
+
+def _hash(conteudo):
+    return sha1(_VOLATIL.sub('', conteudo or '')).hexdigest()
+
+
+class Base(object):
+    '''
+    Base com as últimas respostas de cada (ano, documento). etapas segue
+    tse.prestacao_de_contas.etapas.
+
+    >>> from mimetools import Message
+    >>> from StringIO import StringIO
+    >>> class Pagina(object):
+    ...     nao_modificado, cabecalhos = False, Message(StringIO(''))
+    ...     def __init__(self, conteudo):
+    ...         self.conteudo = conteudo
+    >>> respostas = [Pagina('10,00'), IOError('TSE fora do ar'), Pagina('12,00')]
+    >>> def consulta(pessoa, cabecalhos):
+    ...     resposta = respostas.pop(0)
+    ...     if isinstance(resposta, Exception):
+    ...         raise resposta
+    ...     return resposta
+    >>> def extrai(pagina):
+    ...     return [[u'JOSE', u'PT - SP', u'', unicode(pagina.conteudo), u'']]
+    >>> base = Base(':memory:', {2006: (consulta, extrai)})
+    >>> def mudancas():
+    ...     return [(tipo, (nova or antiga)[8])
+    ...             for tipo, ano, documento, antiga, nova
+    ...             in base.atualiza('560.683.325-51', [2006])]
+    >>> mudancas()
+    [('adicionada', u'10,00')]
+    >>> mudancas()
+    []
+    >>> mudancas()
+    [('alterada', u'12,00')]
+    '''
+
+    def __init__(self, caminho, etapas=None):
+        self._conexao = sqlite3.connect(caminho)
+        self._conexao.executescript(_ESQUEMA)
+        self.etapas = etapas or etapas_do_tse
+
+
+    def atualiza(self, cnpj_ou_cpf, anos=(2004, 2006, 2008)):
+        '''Consulta de novo o documento nos anos informados e gera
+        (tipo, ano, documento, linha antiga, linha nova) para cada mudança
+        desde a última vez'''
+        pessoa = pessoa_or_valueerror(cnpj_ou_cpf)
+        documento = pessoa.plain()
+        for ano in anos:
+            for tipo, antiga, nova in self._atualiza(ano, pessoa):
+                yield tipo, ano, documento, antiga, nova
+
+
+    def _atualiza(self, ano, pessoa):
+        documento = pessoa.plain()
+        anterior = self._conexao.execute(
+            'SELECT hash, etag, modificado, linhas FROM respostas '
+            'WHERE ano = ? AND documento = ?', (ano, documento)).fetchone()
+
+        cabecalhos = {}
+        antigas = []
+        if anterior is not None:
+            hash_anterior, etag, modificado, linhas = anterior
+            antigas = json.loads(linhas)
+            if etag:
+                cabecalhos['If-None-Match'] = etag
+            if modificado:
+                cabecalhos['If-Modified-Since'] = modificado
+
+        consulta, extrai = self.etapas[ano]
+        # sem linhas guardadas, o índice basta para saber que nada mudou; com
+        # elas, um índice desatualizado geraria remoções falsas
+        if not antigas and not _talvez_doador(ano, pessoa):
+            return []
+        try:
+            scraper = consulta(pessoa, cabecalhos)
+        except Exception:
+            logging.exception('Erro consultando %s em %d, mantendo as linhas '
+                              'anteriores' % (documento, ano))
+            return []
+        if scraper is not None and scraper.nao_modificado:
+            return []
+
+        etag = modificado = None
+        conteudo = ''
+        if scraper is not None:
+            conteudo = scraper.conteudo
+            etag = scraper.cabecalhos.getheader('ETag')
+            modificado = scraper.cabecalhos.getheader('Last-Modified')
+
+        novo_hash = _hash(conteudo)
+        if anterior is not None and novo_hash == hash_anterior:
+            return []
+
+        novas = normaliza(ano, extrai(scraper))
+        with self._conexao:
+            self._conexao.execute(
+                'INSERT OR REPLACE INTO respostas VALUES (?, ?, ?, ?, ?, ?)',
+                (ano, documento, novo_hash, etag, modificado,
+                 json.dumps(novas)))
+        return list(diferencas(antigas, novas))
+
+
+    def close(self):
+        self._conexao.close()
+
+
+if __name__ == '__main__':
+    from csv import writer as csv_writer
+
+    from tse.prestacao_de_contas import perfil_doador
+
+    if len(sys.argv) < 2:
+        print __doc__.split('\n\n')[0].strip()
+        sys.exit(1)
+
+    anos = tuple(int(ano) for ano in sys.argv[2:]) or (2004, 2006, 2008)
+    base = Base(sys.argv[1])
+
+    csv = csv_writer(sys.stdout)
+    csv.writerow(['Mudança', 'CNPJ ou CPF'] + perfil_doador.campos +
+                 ['Valor anterior', 'Tipo anterior'])
+    for linha in sys.stdin:
+        for tipo, ano, documento, antiga, nova in base.atualiza(linha.strip(),
+                                                                 anos):
+            anteriores = [u'', u'']
+            if tipo == 'alterada':
+                anteriores = antiga[8:10]
+            csv.writerow([tipo, documento] +
+                         [campo.encode('utf8')
+                          for campo in (nova or antiga) + anteriores])
+    base.close()
+
+
+# vim:tabstop=4:expandtab:smartindent:encoding=utf8
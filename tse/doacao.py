@@ -0,0 +1,150 @@
+#!/usr/bin/env python
+# coding: utf8
+#
+# Registros tipados das doações, com valores em centavos e datas já
+# convertidos
+#
+# (c) Copyright 2009 by Narcelio Filho <narcelio@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+'''
+As tabelas de doador_<ano> são listas de strings no formato do TSE ("1.500,00",
+"02/08/2006", "PSDB - TO"), e doador_2008 ainda devolve str em utf8. Aqui elas
+são convertidas uma única vez para objetos Doacao, e as agregações trabalham
+direto com inteiros:
+
+>>> tabela = [[u'JOSE', u'PSDB - TO', u'02/08/2006', u'10.000,00', u'Recursos'],
+...           [u'JOSE', u'PSDB - TO', u'03/08/2006', u'1.500,50', u'Recursos'],
+...           [u'MARIA', u'PT - SP', u'04/08/2006', u'0,99', u'Recursos']]
+>>> doacoes = converte(2006, tabela, '46960724104')
+>>> doacoes[0]
+Doacao(2006, u'JOSE', u'PSDB', u'TO', datetime.date(2006, 8, 2), 1000000)
+>>> sorted(totais(doacoes).items())
+[(u'JOSE', 1150050), (u'MARIA', 99)]
+>>> totais(doacoes, 'uf')[u'SP']
+99
+'''
+
+from datetime import date
+from re import compile as regexp
+
+from tse.prestacao_de_contas import normaliza
+
+
+_VALOR = regexp(r'^\s*(?:R\$\s*)?(-?)(\d{1,3}(?:\.\d{3})*|\d+),(\d{2})\s*$')
+_DATA = regexp(r'^\s*(\d{2})/(\d{2})/(\d{4})\s*$')
+
+# as datas se repetem muito, então cada uma só é convertida uma vez
+_datas = {}
+
+
+def centavos(valor):
+    '''
+    Converte um valor no formato brasileiro para um inteiro em centavos.
+
+    >>> centavos(u'1.500,00')
+    150000
+    >>> centavos('R$ 2,05')
+    205
+    >>> centavos(u'1,5')
+    Traceback (most recent call last):
+    ...
+    ValueError: Valor inválido: u'1,5'
+    '''
+
+    m = _VALOR.match(valor)
+    if m is None:
+        raise ValueError('Valor inválido: %r' % valor)
+    sinal, reais, decimos = m.groups()
+    resultado = int(reais.replace('.', '')) * 100 + int(decimos)
+    if sinal:
+        return -resultado
+    return resultado
+
+
+def data(texto):
+    '''
+    Converte uma data dd/mm/aaaa para datetime.date, ou None se estiver vazia.
+
+    >>> data(u'02/08/2006')
+    datetime.date(2006, 8, 2)
+    >>> data(u'') is None
+    True
+    '''
+
+    try:
+        return _datas[texto]
+    except KeyError:
+        pass
+
+    if not texto.strip():
+        resultado = None
+    else:
+        m = _DATA.match(texto)
+        if m is None:
+            raise ValueError('Data inválida: %r' % texto)
+        dia, mes, ano = m.groups()
+        resultado = date(int(ano), int(mes), int(dia))
+    _datas[texto] = resultado
+    return resultado
+
+
+class Doacao(object):
+    '''Uma doação, com os campos de perfil_doador.campos já convertidos'''
+
+    __slots__ = ('ano', 'candidato', 'numero', 'partido', 'uf', 'municipio',
+                 'candidatura', 'data', 'centavos', 'tipo', 'documento')
+
+    def __init__(self, linha, documento=None):
+        '''linha segue os campos de perfil_doador.campos'''
+        (ano, self.candidato, self.numero, self.partido, self.uf,
+         self.municipio, self.candidatura, texto_data, valor,
+         self.tipo) = linha[:10]
+        self.ano = int(ano)
+        self.data = data(texto_data)
+        self.centavos = centavos(valor)
+        self.documento = documento
+
+
+    def __repr__(self):
+        return 'Doacao(%d, %r, %r, %r, %r, %d)' % (
+            self.ano, self.candidato, self.partido, self.uf, self.data,
+            self.centavos)
+
+
+def converte(ano, tabela, documento=None):
+    '''Converte uma tabela inteira de doador_<ano> (ou já normalizada, com
+    ano None) para uma lista de Doacao'''
+    if ano is not None:
+        tabela = normaliza(ano, tabela)
+    return [Doacao(linha, documento) for linha in tabela]
+
+
+def totais(doacoes, campo='candidato'):
+    '''Soma os centavos das doações agrupando pelo campo informado'''
+    resultado = {}
+    for doacao in doacoes:
+        chave = getattr(doacao, campo)
+        resultado[chave] = resultado.get(chave, 0) + doacao.centavos
+    return resultado
+
+
+if __name__ == '__main__':
+    import doctest
+    doctest.testmod()
+
+
+# vim:tabstop=4:expandtab:smartindent:encoding=utf8
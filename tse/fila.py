@@ -0,0 +1,426 @@
+#!/usr/bin/env python
+# coding: utf8
+#
+# Fila de trabalho para distribuir as consultas de doadores entre vários
+# processos e máquinas
+#
+# (c) Copyright 2009 by Narcelio Filho <narcelio@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+'''
+uso:
+    fila.py coordena fila.db [-d delimitador] [arquivo [coluna]]
+    fila.py trabalha fila.db [processos] [-i ano:indice.idx]...
+    fila.py situacao fila.db
+    fila.py falhas fila.db
+    fila.py resultados fila.db > resultados.csv
+
+O coordenador divide os documentos válidos em unidades de trabalho numa base
+SQLite. Cada trabalhador reserva uma unidade por vez, renovando a reserva a
+cada documento consultado; se ele morrer, a reserva expira e a unidade volta
+para a fila. Os resultados de um documento são sempre regravados por inteiro,
+então consultá-lo duas vezes não duplica linhas.
+
+Um documento cuja consulta falha não impede os seguintes: ele é registrado em
+falhas e, no fim da unidade, vai para uma nova unidade só com os que falharam.
+Essa unidade (como uma liberada por outro erro) só volta a ser reservada
+depois de um intervalo que dobra a cada tentativa, e é abandonada depois de
+TENTATIVAS tentativas.
+
+Para usar várias máquinas, a base precisa estar num sistema de arquivos
+compartilhado com suporte a travas (locks). Com -i, cada trabalhador consulta
+o índice de doadores conhecidos do ano (veja tse/indice.py) antes do TSE.
+
+>>> import os, tempfile
+>>> caminho = os.path.join(tempfile.mkdtemp(), 'fila.db')
+>>> enfileira(caminho, ['11.222.333/0001-81', 'x', '560.683.325-51'], tamanho=1)
+2
+>>> def consulta(documento, anos):
+...     return [[u'2006', u'FULANO', u'', u'PT', u'SP', u'', u'', u'', u'1,00', u'']], {}
+>>> trabalha(caminho, consulta=consulta)
+2
+>>> situacao(caminho)['concluida']
+2
+>>> [linha[-1] for linha in resultados(caminho)]
+[u'11222333000181', u'56068332551']
+
+>>> caminho = os.path.join(tempfile.mkdtemp(), 'fila.db')
+>>> enfileira(caminho, ['11.222.333/0001-81', '560.683.325-51'])
+2
+>>> def instavel(documento, anos):
+...     if documento == '11222333000181':
+...         raise IOError('TSE fora do ar')
+...     return consulta(documento, anos)
+>>> trabalha(caminho, consulta=instavel, recuo=0)
+1
+>>> situacao(caminho)['falhou'], [linha[-1] for linha in resultados(caminho)]
+(1, [u'56068332551'])
+>>> falhas(caminho)
+[(u'11222333000181', 5, u'TSE fora do ar')]
+'''
+
+import json
+import logging
+import os
+import socket
+import sqlite3
+import sys
+from time import sleep
+from time import time
+
+from entrada import validos
+
+
+VISIBILIDADE = 300
+TENTATIVAS = 5
+RECUO = 30
+RECUO_MAXIMO = 3600
+
+_ESQUEMA = '''
+CREATE TABLE IF NOT EXISTS unidades (
+    id INTEGER PRIMARY KEY,
+    documentos TEXT NOT NULL,
+    estado TEXT NOT NULL DEFAULT 'pendente',
+    dono TEXT,
+    prazo REAL NOT NULL DEFAULT 0,
+    tentativas INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS unidades_estado ON unidades (estado, prazo);
+CREATE TABLE IF NOT EXISTS resultados (
+    documento TEXT NOT NULL,
+    linha INTEGER NOT NULL,
+    dados TEXT NOT NULL,
+    PRIMARY KEY (documento, linha)
+);
+CREATE TABLE IF NOT EXISTS falhas (
+    documento TEXT PRIMARY KEY,
+    tentativas INTEGER NOT NULL,
+    erro TEXT NOT NULL
+);
+'''
+
+
+def conecta(caminho):
+    '''Abre a base da fila, criando as tabelas se for preciso. As transações
+    são controladas explicitamente (BEGIN IMMEDIATE).'''
+    conexao = sqlite3.connect(caminho, timeout=60, isolation_level=None)
+    conexao.executescript(_ESQUEMA)
+    return conexao
+
+
+def enfileira(caminho, documentos, tamanho=100):
+    '''Divide os documentos válidos em unidades de "tamanho" documentos e as
+    coloca na fila. Retorna quantos documentos foram enfileirados.'''
+    conexao = conecta(caminho)
+    total = 0
+    try:
+        conexao.execute('BEGIN IMMEDIATE')
+        unidade = []
+        for documento in validos(documentos):
+            unidade.append(documento)
+            if len(unidade) == tamanho:
+                total += _insere(conexao, unidade)
+                unidade = []
+        if unidade:
+            total += _insere(conexao, unidade)
+        conexao.execute('COMMIT')
+    finally:
+        conexao.close()
+    return total
+
+
+def _insere(conexao, unidade):
+    conexao.execute('INSERT INTO unidades (documentos) VALUES (?)',
+                    (' '.join(unidade),))
+    return len(unidade)
+
+
+def _reserva(conexao, dono, visibilidade):
+    '''Reserva a próxima unidade pendente ou com a reserva vencida. Retorna
+    (id, documentos), ou None se não houver nenhuma disponível agora.'''
+    agora = time()
+    conexao.execute('BEGIN IMMEDIATE')
+    try:
+        while True:
+            linha = conexao.execute(
+                "SELECT id, documentos, tentativas FROM unidades "
+                "WHERE estado = 'pendente' AND prazo < ? ORDER BY id LIMIT 1",
+                (agora,)).fetchone()
+            if linha is None:
+                return None
+            unidade, documentos, tentativas = linha
+            if tentativas < TENTATIVAS:
+                break
+            logging.error('Unidade %d falhou %d vezes, desistindo'
+                          % (unidade, tentativas))
+            conexao.execute("UPDATE unidades SET estado = 'falhou' "
+                            "WHERE id = ?", (unidade,))
+
+        conexao.execute(
+            'UPDATE unidades SET dono = ?, prazo = ?, '
+            'tentativas = tentativas + 1 WHERE id = ?',
+            (dono, agora + visibilidade, unidade))
+        return unidade, documentos.split()
+    finally:
+        conexao.execute('COMMIT')
+
+
+def _renova(conexao, unidade, dono, visibilidade):
+    '''Estende a reserva (heartbeat). Retorna False se ela já foi perdida.'''
+    cursor = conexao.execute(
+        "UPDATE unidades SET prazo = ? "
+        "WHERE id = ? AND dono = ? AND estado = 'pendente'",
+        (time() + visibilidade, unidade, dono))
+    return cursor.rowcount == 1
+
+
+def _grava(conexao, documento, tabela):
+    # apaga antes de inserir, para que repetir a consulta não duplique linhas
+    conexao.execute('BEGIN IMMEDIATE')
+    try:
+        conexao.execute('DELETE FROM resultados WHERE documento = ?',
+                        (documento,))
+        conexao.executemany(
+            'INSERT INTO resultados (documento, linha, dados) VALUES (?, ?, ?)',
+            [(documento, numero, json.dumps(linha))
+             for numero, linha in enumerate(tabela)])
+        conexao.execute('DELETE FROM falhas WHERE documento = ?',
+                        (documento,))
+    finally:
+        conexao.execute('COMMIT')
+
+
+def _registra_falha(conexao, documento, erro):
+    conexao.execute(
+        'INSERT OR REPLACE INTO falhas VALUES (?, COALESCE((SELECT tentativas '
+        'FROM falhas WHERE documento = ?), 0) + 1, ?)',
+        (documento, documento, unicode(erro)))
+
+
+# fim do intervalo de espera, que dobra a cada tentativa até RECUO_MAXIMO;
+# os parâmetros vêm de _recuo()
+_PRAZO = '? + MIN(? * (1 << MIN(tentativas - 1, 20)), ?)'
+
+
+def _recuo(recuo):
+    return time(), recuo, max(recuo, RECUO_MAXIMO)
+
+
+def _conclui(conexao, unidade, dono, falhos, recuo):
+    '''Conclui a unidade, passando os documentos que falharam para uma nova
+    unidade que só pode ser reservada depois do intervalo de espera'''
+    conexao.execute('BEGIN IMMEDIATE')
+    try:
+        if falhos:
+            conexao.execute(
+                'INSERT INTO unidades (documentos, prazo, tentativas) '
+                'SELECT ?, %s, tentativas FROM unidades WHERE id = ?'
+                % _PRAZO, ((' '.join(falhos),) + _recuo(recuo) + (unidade,)))
+        conexao.execute("UPDATE unidades SET estado = 'concluida' "
+                        "WHERE id = ? AND dono = ?", (unidade, dono))
+    finally:
+        conexao.execute('COMMIT')
+
+
+def _libera(conexao, unidade, dono, recuo):
+    conexao.execute('UPDATE unidades SET dono = NULL, prazo = %s '
+                    'WHERE id = ? AND dono = ?' % _PRAZO,
+                    _recuo(recuo) + (unidade, dono))
+
+
+def trabalha(caminho, anos=(2004, 2006, 2008), consulta=None,
+             visibilidade=VISIBILIDADE, espera=5, indices=(), recuo=RECUO):
+    '''
+    Consome unidades da fila até que não haja mais nenhuma pendente, e retorna
+    quantos documentos foram consultados. consulta(documento, anos) deve
+    retornar (tabela, tempos) como tse.prestacao_de_contas.perfil_doador().
+    indices são especificações "ano:caminho" para usa_indices(), e recuo é o
+    intervalo em segundos antes de repetir uma unidade que falhou.
+    '''
+
+    if indices:
+        from tse.prestacao_de_contas import usa_indices
+        usa_indices(indices)
+    if consulta is None:
+        from tse.prestacao_de_contas import perfil_doador as consulta
+
+    dono = '%s:%d' % (socket.gethostname(), os.getpid())
+    conexao = conecta(caminho)
+    consultados = 0
+    try:
+        while True:
+            reserva = _reserva(conexao, dono, visibilidade)
+            if reserva is None:
+                pendentes = conexao.execute(
+                    "SELECT COUNT(*) FROM unidades "
+                    "WHERE estado = 'pendente'").fetchone()[0]
+                if not pendentes:
+                    return consultados
+                # as restantes estão reservadas por outros trabalhadores ou
+                # esperando para serem repetidas
+                sleep(espera)
+                continue
+
+            unidade, documentos = reserva
+            logging.info('%s: unidade %d com %d documentos'
+                         % (dono, unidade, len(documentos)))
+            try:
+                falhos = []
+                for documento in documentos:
+                    try:
+                        tabela, tempos = consulta(documento, anos)
+                    except Exception, e:
+                        logging.exception('%s: erro consultando %s'
+                                          % (dono, documento))
+                        _registra_falha(conexao, documento, e)
+                        falhos.append(documento)
+                    else:
+                        _grava(conexao, documento,
+                               [linha + [documento] for linha in tabela])
+                        consultados += 1
+                    if not _renova(conexao, unidade, dono, visibilidade):
+                        logging.warning('%s: reserva da unidade %d perdida'
+                                        % (dono, unidade))
+                        break
+                else:
+                    _conclui(conexao, unidade, dono, falhos, recuo)
+            except Exception:
+                logging.exception('%s: erro na unidade %d' % (dono, unidade))
+                _libera(conexao, unidade, dono, recuo)
+    finally:
+        conexao.close()
+
+
+def trabalha_em_paralelo(caminho, processos, **kw):
+    '''Roda "processos" trabalhadores locais e espera todos terminarem'''
+    from multiprocessing import Process
+
+    filhos = [Process(target=trabalha, args=(caminho,), kwargs=kw)
+              for _ in xrange(processos)]
+    for filho in filhos:
+        filho.start()
+    for filho in filhos:
+        filho.join()
+
+
+def situacao(caminho):
+    '''Retorna a quantidade de unidades em cada estado'''
+    conexao = conecta(caminho)
+    try:
+        return dict(conexao.execute(
+            'SELECT estado, COUNT(*) FROM unidades GROUP BY estado'))
+    finally:
+        conexao.close()
+
+
+def falhas(caminho):
+    '''Retorna (documento, tentativas, último erro) dos documentos cuja
+    consulta falhou e ainda não deu certo'''
+    conexao = conecta(caminho)
+    try:
+        return conexao.execute('SELECT documento, tentativas, erro '
+                               'FROM falhas ORDER BY documento').fetchall()
+    finally:
+        conexao.close()
+
+
+def resultados(caminho):
+    '''Gera as linhas consultadas, nos campos de perfil_doador.campos seguidos
+    do documento'''
+    conexao = conecta(caminho)
+    try:
+        for (dados,) in conexao.execute(
+                'SELECT dados FROM resultados ORDER BY documento, linha'):
+            yield json.loads(dados)
+    finally:
+        conexao.close()
+
+
+if __name__ == '__main__':
+    from csv import writer as csv_writer
+
+    logging.basicConfig(level=logging.INFO)
+
+    if len(sys.argv) < 3:
+        print __doc__.split('\n\n')[0].strip()
+        sys.exit(1)
+
+    comando, caminho = sys.argv[1:3]
+    if comando == 'coordena':
+        from getopt import GetoptError
+        from getopt import gnu_getopt
+
+        import entrada
+
+        try:
+            opcoes, argumentos = gnu_getopt(sys.argv[3:], 'd:')
+            delimitador = entrada.delimitador(dict(opcoes).get('-d', ','))
+            if argumentos:
+                coluna = None
+                if len(argumentos) > 1:
+                    coluna = argumentos[1]
+                    if coluna.isdigit():
+                        coluna = int(coluna)
+                # com uma coluna, a primeira linha é o cabeçalho
+                documentos = entrada.tokens(argumentos[0], coluna,
+                                            delimitador,
+                                            cabecalho=coluna is not None)
+            else:
+                documentos = (palavra for linha in sys.stdin
+                                      for palavra in linha.split())
+            print enfileira(caminho, documentos), 'documentos enfileirados'
+        except (GetoptError, ValueError), e:
+            print >>sys.stderr, e
+            print __doc__.split('\n\n')[0].strip()
+            sys.exit(1)
+    elif comando == 'trabalha':
+        from getopt import GetoptError
+        from getopt import gnu_getopt
+
+        from tse.prestacao_de_contas import usa_indices
+
+        try:
+            opcoes, argumentos = gnu_getopt(sys.argv[3:], 'i:')
+            indices = [valor for opcao, valor in opcoes]
+            # confere os índices antes de iniciar os trabalhadores
+            usa_indices(indices)
+        except (GetoptError, ValueError, IOError), e:
+            print >>sys.stderr, e
+            print __doc__.split('\n\n')[0].strip()
+            sys.exit(1)
+        processos = 1
+        if argumentos:
+            processos = int(argumentos[0])
+        trabalha_em_paralelo(caminho, processos, indices=indices)
+    elif comando == 'situacao':
+        for estado, quantidade in sorted(situacao(caminho).items()):
+            print estado, quantidade
+    elif comando == 'falhas':
+        for documento, tentativas, erro in falhas(caminho):
+            print '%s\t%d\t%s' % (documento, tentativas, erro.encode('utf8'))
+    elif comando == 'resultados':
+        from tse.prestacao_de_contas import perfil_doador
+
+        csv = csv_writer(sys.stdout)
+        csv.writerow(perfil_doador.campos + ['CNPJ ou CPF'])
+        csv.writerows([campo.encode('utf8') for campo in linha]
+                      for linha in resultados(caminho))
+    else:
+        print __doc__.split('\n\n')[0].strip()
+        sys.exit(1)
+
+
+# vim:tabstop=4:expandtab:smartindent:encoding=utf8
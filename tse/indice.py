@@ -0,0 +1,243 @@
+#!/usr/bin/env python
+# coding: utf8
+#
+# Índice compacto (filtro de Bloom) de doadores conhecidos, para responder sem
+# consultar o TSE que um CNPJ ou CPF certamente não fez doações
+#
+# (c) Copyright 2009 by Narcelio Filho <narcelio@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+'''
+uso: indice.py [-t taxa] [-c capacidade] [-d delim] indice.idx [csv coluna]
+     indice.py -a [-d delim] indice.idx [csv coluna]
+
+Cria (ou, com -a, atualiza) um índice com os documentos lidos do CSV, na coluna
+informada (separada por vírgulas ou pelo delimitador de -d, como "-d ';'" ou
+"-d tab"), ou da entrada padrão. A taxa de falsos positivos e a capacidade de
+um índice existente não mudam, então -a não aceita -t nem -c. Pode ser usado
+com os resultados já obtidos de um ano, por exemplo:
+
+    indice.py doadores-2006.idx resultado-2006.csv 'CNPJ ou CPF'
+
+O índice só é útil se tiver todos os doadores do ano: um documento que não
+está no índice é tratado como não doador sem consulta ao TSE.
+'''
+
+import logging
+import mmap
+import os
+import struct
+import sys
+from hashlib import md5
+from math import ceil
+from math import log
+
+
+_MAGICO = 'TSEBLOOM'
+# mágico, número de hashes, bits, documentos inseridos, capacidade
+_CABECALHO = struct.Struct('<8sIQQQ')
+
+
+class Indice(object):
+    '''
+    Filtro de Bloom sobre os dígitos de CNPJs e CPFs normalizados (como em
+    Cnpj.plain() e Cpf.plain()). Um documento fora do índice certamente não foi
+    inserido; um documento dentro dele foi inserido, exceto numa fração "taxa"
+    dos casos.
+
+    >>> indice = Indice(1000, taxa=0.01)
+    >>> indice.adiciona('11222333000181')
+    >>> '11222333000181' in indice
+    True
+    >>> '56068332551' in indice
+    False
+    >>> indice.k, indice.m
+    (7, 9586)
+    >>> Indice(1000, taxa=1)
+    Traceback (most recent call last):
+    ...
+    ValueError: A taxa precisa estar entre 0 e 1, e não 1
+    '''
+
+    def __init__(self, capacidade, taxa=0.01):
+        if not 0 < taxa < 1:
+            raise ValueError('A taxa precisa estar entre 0 e 1, e não %r'
+                             % taxa)
+        if capacidade < 1:
+            raise ValueError('A capacidade precisa ser positiva, e não %r'
+                             % capacidade)
+        self.capacidade = capacidade
+        self.m = int(ceil(-capacidade * log(taxa) / log(2) ** 2))
+        self.k = max(1, int(round(float(self.m) / capacidade * log(2))))
+        self.n = 0
+        self._bits = bytearray((self.m + 7) // 8)
+        self._mapa = None
+
+
+    def _posicoes(self, documento):
+        # hash duplo: as k posições saem de dois inteiros de 64 bits do md5
+        h1, h2 = struct.unpack('<QQ', md5(documento).digest())
+        return [(h1 + i * h2) % self.m for i in xrange(self.k)]
+
+
+    def adiciona(self, documento):
+        '''Insere o documento no índice'''
+        if self._mapa is not None:
+            raise ValueError('Índice aberto só para leitura')
+        for posicao in self._posicoes(documento):
+            self._bits[posicao >> 3] |= 1 << (posicao & 7)
+        self.n += 1
+        if self.n == self.capacidade + 1:
+            logging.warning('Índice acima da capacidade (%d), a taxa de '
+                            'falsos positivos vai aumentar' % self.capacidade)
+
+
+    def __contains__(self, documento):
+        bits = self._bits
+        if self._mapa is None:
+            for posicao in self._posicoes(documento):
+                if not bits[posicao >> 3] & (1 << (posicao & 7)):
+                    return False
+        else:
+            # mmap devolve str de um caractere
+            inicio = _CABECALHO.size
+            for posicao in self._posicoes(documento):
+                if not ord(bits[inicio + (posicao >> 3)]) & (1 << (posicao & 7)):
+                    return False
+        return True
+
+
+    def salva(self, caminho):
+        '''Grava o índice em caminho. O arquivo é trocado de uma vez, então
+        quem estiver com o índice antigo aberto não é afetado.'''
+        temporario = '%s.%d.tmp' % (caminho, os.getpid())
+        arquivo = open(temporario, 'wb')
+        try:
+            arquivo.write(_CABECALHO.pack(_MAGICO, self.k, self.m, self.n,
+                                          self.capacidade))
+            arquivo.write(self._bits_em_bytes())
+        finally:
+            arquivo.close()
+        os.rename(temporario, caminho)
+
+
+    def _bits_em_bytes(self):
+        if self._mapa is None:
+            return str(self._bits)
+        return self._mapa[_CABECALHO.size:]
+
+
+    @classmethod
+    def abre(cls, caminho, escrita=False):
+        '''
+        Abre um índice salvo. Para leitura, o arquivo é mapeado em memória e
+        só as páginas usadas são carregadas; com escrita=True os bits são
+        copiados para a memória, para que novos documentos possam ser
+        adicionados e o índice salvo de novo (reconstrução incremental).
+        '''
+
+        arquivo = open(caminho, 'rb')
+        try:
+            mapa = mmap.mmap(arquivo.fileno(), 0, access=mmap.ACCESS_READ)
+        finally:
+            arquivo.close()
+
+        magico, k, m, n, capacidade = _CABECALHO.unpack(
+            mapa[:_CABECALHO.size])
+        if magico != _MAGICO:
+            mapa.close()
+            raise ValueError('%s não é um índice de doadores' % caminho)
+
+        indice = cls.__new__(cls)
+        indice.k, indice.m, indice.n = k, m, n
+        indice.capacidade = capacidade
+        if escrita:
+            indice._bits = bytearray(mapa[_CABECALHO.size:])
+            indice._mapa = None
+            mapa.close()
+        else:
+            indice._bits = indice._mapa = mapa
+        return indice
+
+
+def constroi(documentos, capacidade, taxa=0.01):
+    '''Cria um índice com os documentos informados'''
+    indice = Indice(capacidade, taxa)
+    for documento in documentos:
+        indice.adiciona(documento)
+    return indice
+
+
+if __name__ == '__main__':
+    from getopt import GetoptError
+    from getopt import getopt
+
+    import entrada
+
+    def uso(erro=None):
+        if erro is not None:
+            print >>sys.stderr, erro
+        print __doc__.split('\n\n')[0].strip()
+        sys.exit(1)
+
+    try:
+        opcoes, argumentos = getopt(sys.argv[1:], 't:c:ad:')
+    except GetoptError, e:
+        uso(e)
+    opcoes = dict(opcoes)
+    if len(argumentos) not in (1, 3) or (
+            '-a' in opcoes and ('-t' in opcoes or '-c' in opcoes)):
+        uso()
+
+    try:
+        delimitador = entrada.delimitador(opcoes.get('-d', ','))
+        taxa = float(opcoes.get('-t', 0.01))
+        capacidade = None
+        if '-c' in opcoes:
+            capacidade = int(opcoes['-c'])
+            Indice(capacidade, taxa)
+        else:
+            # só para validar a taxa antes de ler os documentos
+            Indice(1, taxa)
+    except ValueError, e:
+        uso(e)
+
+    if len(argumentos) == 3:
+        coluna = argumentos[2]
+        if coluna.isdigit():
+            coluna = int(coluna)
+        try:
+            documentos = list(entrada.validos(entrada.tokens(
+                argumentos[1], coluna, delimitador, cabecalho=True)))
+        except ValueError, e:
+            uso(e)
+    else:
+        documentos = list(entrada.validos(sys.stdin.read().split()))
+
+    caminho = argumentos[0]
+    if '-a' in opcoes:
+        indice = Indice.abre(caminho, escrita=True)
+    else:
+        if capacidade is None:
+            capacidade = max(len(documentos), 1)
+        indice = Indice(capacidade, taxa)
+
+    for documento in documentos:
+        indice.adiciona(documento)
+    indice.salva(caminho)
+
+
+# vim:tabstop=4:expandtab:smartindent:encoding=utf8
@@ -0,0 +1,68 @@
+#!/usr/bin/env python
+# coding: utf8
+#
+# Validação de CNPJs e CPFs, sem dependências de rede
+#
+# (c) Copyright 2009 by Narcelio Filho <narcelio@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+from cnpj import Cnpj
+from cpf import Cpf
+
+
+def _unico_algarismo_repetido(s):
+    return s == (s[0] * len(s))
+
+
+def pessoa_or_valueerror(cnpj_ou_cpf):
+    '''
+    Retorna um Cnpj ou Cpf válido, ou levanta ValueError.
+
+    >>> pessoa_or_valueerror('11.222.333/0001-81')
+    Cnpj('11222333000181')
+    >>> pessoa_or_valueerror('111.111.111-11')
+    Traceback (most recent call last):
+    ...
+    ValueError: CNPJ/CPF inválido
+    >>> pessoa_or_valueerror(Cpf('111.111.111-11'))
+    Traceback (most recent call last):
+    ...
+    ValueError: CNPJ/CPF inválido
+    '''
+
+    # já validado antes, não precisa converter de novo
+    if isinstance(cnpj_ou_cpf, Cnpj) and cnpj_ou_cpf.valido():
+        return cnpj_ou_cpf
+    if (isinstance(cnpj_ou_cpf, Cpf) and cnpj_ou_cpf.valido() and
+            not _unico_algarismo_repetido(cnpj_ou_cpf.plain())):
+        return cnpj_ou_cpf
+    if isinstance(cnpj_ou_cpf, (Cnpj, Cpf)):
+        cnpj_ou_cpf = cnpj_ou_cpf.plain()
+
+    pessoa = Cnpj(cnpj_ou_cpf)
+    if not pessoa.valido():
+        pessoa = Cpf(cnpj_ou_cpf)
+        if not pessoa.valido() or _unico_algarismo_repetido(pessoa.plain()):
+            raise ValueError('CNPJ/CPF inválido')
+    return pessoa
+
+
+if __name__ == '__main__':
+    import doctest
+    doctest.testmod()
+
+
+# vim:tabstop=4:expandtab:smartindent:encoding=utf8
@@ -20,25 +20,79 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 #
 
+import logging
+import sys
 from re import compile as regexp
+from threading import Thread
+from time import time
 
-from scraper import Scraper
-from scraper import html2unicode
-from cnpj import Cnpj
-from cpf import Cpf
+from scraper import novo_scraper
+from texto import decodifica_tabela
+from tse.indice import Indice
+from tse.pessoa import pessoa_or_valueerror
 
 
 scraper = None
 
-def pessoa_or_valueerror(cnpj_ou_cpf):
-    pessoa = Cnpj(cnpj_ou_cpf)
-    if not pessoa.valido():
-        pessoa = Cpf(cnpj_ou_cpf)
-        def unico_algarismo_repetido(s):
-            return s == (s[0] * len(s))
-        if not pessoa.valido() or unico_algarismo_repetido(pessoa.plain()):
-            raise ValueError('CNPJ/CPF inválido')
-    return pessoa
+# índices de doadores conhecidos por ano, veja usa_indice()
+indices = {}
+
+
+class ConsultaFalhou(Exception):
+    '''A consulta ao TSE não chegou à página de resultado, o que não quer dizer
+    que a pessoa não fez doações'''
+
+
+def usa_indice(ano, caminho):
+    '''Passa a consultar o índice salvo em caminho (veja tse/indice.py) antes
+    de cada consulta de doador_<ano>. Documentos fora do índice são tratados
+    como não doadores, sem acesso ao TSE.'''
+    indices[ano] = Indice.abre(caminho)
+
+
+def usa_indices(especificacoes):
+    '''Chama usa_indice() para cada especificação "ano:caminho", como nas
+    opções -i dos programas em lote. Levanta ValueError se alguma estiver
+    mal formada.'''
+    for especificacao in especificacoes:
+        ano, separador, caminho = especificacao.partition(':')
+        if not (ano.isdigit() and separador and caminho):
+            raise ValueError('Índice inválido: %r, use ano:caminho'
+                             % especificacao)
+        usa_indice(int(ano), caminho)
+
+
+def _talvez_doador(ano, pessoa):
+    indice = indices.get(ano)
+    return indice is None or pessoa.plain() in indice
+
+
+# mensagens com que o sistema de consulta diz que não há doações
+_SEM_RESULTADO = regexp(u'(?i)n.o retornou resultado|nenhum.{0,40}encontrad|'
+                        u'n.o (foi|foram) encontrad')
+
+
+def _sem_resultado(scraper, formulario):
+    '''Confirma que uma página sem a tabela de doações é uma resposta do
+    próprio sistema de consulta, com a mensagem de que nada foi encontrado ou
+    com o formulário de pesquisa de volta. Qualquer outra página (erro,
+    manutenção) levanta ConsultaFalhou.'''
+    html = scraper.html
+    if (html.find(text=_SEM_RESULTADO) or
+            html.find('form', attrs={'name': formulario}) or
+            html.find('form', attrs={'id': formulario})):
+        return None
+    raise ConsultaFalhou('Página inesperada, sem resultado nem mensagem: %s'
+                         % scraper.browser.geturl())
+
+
+def _doador(ano, cnpj_ou_cpf):
+    try:
+        return consulta_doador(ano, cnpj_ou_cpf)
+    except ConsultaFalhou, e:
+        logging.warning('Consulta de %s em %d falhou: %s'
+                        % (cnpj_ou_cpf, ano, e))
+        return None
 
 
 def doador_2004(cnpj_ou_cpf):
@@ -57,8 +111,14 @@ def doador_2004(cnpj_ou_cpf):
     URL: http://www.tse.gov.br/internet/eleicoes/2004/prest_blank.htm
     '''
 
-    pessoa = pessoa_or_valueerror(cnpj_ou_cpf)
-    scraper = Scraper()
+    return _doador(2004, cnpj_ou_cpf)
+
+doador_2004.campos = ['UF', 'Município', 'Partido', 'Nome', 'Número', 'Candidatura', 'Valor']
+
+
+def _consulta_2004(pessoa, cabecalhos=None):
+    # a última requisição é um POST, então não há pedido condicional
+    scraper = novo_scraper((2004, pessoa.plain()))
 
     url = 'http://www.tse.gov.br/sadEleicao2004Prestacao/spce/index.jsp'
     scraper.open(url)
@@ -71,11 +131,18 @@ def doador_2004(cnpj_ou_cpf):
 
     try:
         scraper.submit()
-    except:
+    except Exception, e:
+        raise ConsultaFalhou(e)
+
+    return scraper
+
+
+def _extrai_2004(scraper):
+    if scraper is None:
         return None
 
     if not scraper.html.find(text=regexp('Valor Total de Fornecimento')):
-        return None
+        return _sem_resultado(scraper, 'formDoador')
 
     table = scraper.html.findAll('table')[-1]
 
@@ -87,14 +154,10 @@ def doador_2004(cnpj_ou_cpf):
                 contents = td.b.contents
             except:
                 contents = td.contents
-            content = ' '.join(contents).strip()
-            text = html2unicode(content)
-            columns.append(text)
+            columns.append(' '.join(contents).strip())
         lines.append(columns)
 
-    return lines
-
-doador_2004.campos = ['UF', 'Município', 'Partido', 'Nome', 'Número', 'Candidatura', 'Valor']
+    return decodifica_tabela(lines)
 
 
 def doador_2006(cnpj_ou_cpf):
@@ -113,8 +176,14 @@ def doador_2006(cnpj_ou_cpf):
     URL: http://www.tse.gov.br/internet/eleicoes/2006/prest_contas_blank.htm
     '''
 
-    pessoa = pessoa_or_valueerror(cnpj_ou_cpf)
-    scraper = Scraper()
+    return _doador(2006, cnpj_ou_cpf)
+
+doador_2006.campos = ['Candidato', 'Partido - UF', 'Data', 'Valor', 'Tipo']
+
+
+def _consulta_2006(pessoa, cabecalhos=None):
+    # a última requisição é um POST, então não há pedido condicional
+    scraper = novo_scraper((2006, pessoa.plain()))
 
     url = 'http://www.tse.gov.br/sadSPCE06F3/faces/careceitaByDoador.jsp'
     scraper.open(url)
@@ -122,10 +191,17 @@ def doador_2006(cnpj_ou_cpf):
     scraper.browser.form['frmByDoador:cdCpfCgc'] = pessoa.plain()
     scraper.submit(name='frmByDoador:_id4')
 
+    return scraper
+
+
+def _extrai_2006(scraper):
+    if scraper is None:
+        return None
+
     strong = scraper.html.find('strong', text=regexp('.*prestadas pelo doador.*'))
 
     if strong is None:
-        return None
+        return _sem_resultado(scraper, 'frmByDoador')
 
     table = strong.parent.parent.parent.parent
     table = table.nextSibling.nextSibling.nextSibling.nextSibling
@@ -134,14 +210,10 @@ def doador_2006(cnpj_ou_cpf):
     for tr in table.tbody.findAll('tr'):
         columns = []
         for td in tr.findAll('td'):
-            content = td.contents[0].strip()
-            text = html2unicode(content)
-            columns.append(text)
+            columns.append(td.contents[0].strip())
         lines.append(columns)
 
-    return lines
-
-doador_2006.campos = ['Candidato', 'Partido - UF', 'Data', 'Valor', 'Tipo']
+    return decodifica_tabela(lines)
 
 
 def doador_2008(cnpj_ou_cpf):
@@ -158,8 +230,11 @@ def doador_2008(cnpj_ou_cpf):
     True
     '''
 
-    pessoa = pessoa_or_valueerror(cnpj_ou_cpf)
-    scraper = Scraper()
+    return _doador(2008, cnpj_ou_cpf)
+
+
+def _consulta_2008(pessoa, cabecalhos=None):
+    scraper = novo_scraper((2008, pessoa.plain()))
 
     # primeiro verifica se a pessoa foi doadora
     url = 'http://www.tse.jus.br/spce2008ConsultaFinanciamento/lovPesquisaDoador.jsp'
@@ -183,8 +258,20 @@ def doador_2008(cnpj_ou_cpf):
     scraper.submit()
 
     url = 'http://www.tse.jus.br/spce2008ConsultaFinanciamento/listaReceitaCand.jsp'
-    scraper.open(url)
+    scraper.open(url, cabecalhos)
+
+    return scraper
+
+
+def _extrai_2008(scraper):
+    if scraper is None:
+        return None
+
     td = scraper.html.find('td', attrs={'class':'Left'})
+    if td is None:
+        # _consulta_2008 já confirmou que a pessoa é doadora
+        raise ConsultaFalhou('Página inesperada, sem a tabela de doações: %s'
+                             % scraper.browser.geturl())
 
     fields = []
     while True:
@@ -216,6 +303,151 @@ doador_2008.campos = [
 ]
 
 
+doadores = {
+    2004: doador_2004,
+    2006: doador_2006,
+    2008: doador_2008,
+}
+
+# as duas etapas de doador_<ano>: a consulta, que recebe a pessoa e cabeçalhos
+# extras para a última requisição e retorna o Scraper na página de resultado
+# (ou None se o TSE já respondeu que não há doações), e a extração da tabela.
+# Se a consulta não chegar ao resultado, ou se a página não for nem o resultado
+# nem a resposta de que não há doações, as etapas levantam uma exceção. Só a
+# de 2008 termina num GET, então só ela usa os cabeçalhos num pedido
+# condicional.
+etapas = {
+    2004: (_consulta_2004, _extrai_2004),
+    2006: (_consulta_2006, _extrai_2006),
+    2008: (_consulta_2008, _extrai_2008),
+}
+
+
+def consulta_doador(ano, cnpj_ou_cpf):
+    '''Como doador_<ano>, que retorna None também quando a consulta falha,
+    mas levanta ConsultaFalhou (ou o erro de rede) nesse caso. None quer
+    dizer que o TSE respondeu que não há doações ou que o documento está fora
+    do índice do ano.'''
+    pessoa = pessoa_or_valueerror(cnpj_ou_cpf)
+    if not _talvez_doador(ano, pessoa):
+        return None
+    consulta, extrai = etapas[ano]
+    return extrai(consulta(pessoa))
+
+
+def _normaliza(ano, linha):
+    u'''
+    Converte uma linha da tabela de doador_<ano> para os campos em
+    "perfil_doador.campos".
+
+    >>> _normaliza(2006, [u'FULANO', u'PSDB - TO', u'02/08/2006', u'10,00', u'Recursos'])
+    [u'2006', u'FULANO', u'', u'PSDB', u'TO', u'', u'', u'02/08/2006', u'10,00', u'Recursos']
+    '''
+
+    if ano == 2004:
+        uf, municipio, partido, nome, numero, candidatura, valor = linha
+        data = tipo = u''
+    elif ano == 2006:
+        nome, partido_uf, data, valor, tipo = linha
+        partido, _, uf = partido_uf.partition(u' - ')
+        numero = municipio = candidatura = u''
+    elif ano == 2008:
+        linha = [campo.decode('utf8') for campo in linha]
+        (_, _, data, valor, tipo, _, nome, numero, partido, candidatura,
+         municipio_uf) = linha
+        municipio, _, uf = municipio_uf.rpartition(u'-')
+    else:
+        raise ValueError('Ano sem consulta disponível: %s' % ano)
+
+    return [unicode(ano), nome, numero, partido, uf, municipio, candidatura,
+            data, valor, tipo]
+
+
+def normaliza(ano, tabela):
+    '''Converte o resultado de doador_<ano> para uma lista de linhas com os
+    campos em "perfil_doador.campos"'''
+    if not tabela:
+        return []
+    if ano == 2008:
+        # doador_2008 devolve uma única linha
+        tabela = [tabela]
+    return [_normaliza(ano, linha) for linha in tabela]
+
+
+def _tabela(ano, pessoa):
+    '''Consulta o ano informado e devolve sempre uma lista de linhas. Uma
+    consulta que falha levanta a exceção, em vez de virar uma tabela vazia.'''
+    return normaliza(ano, consulta_doador(ano, pessoa))
+
+
+def perfil_doador(cnpj_ou_cpf, anos=(2004, 2006, 2008)):
+    u'''
+    Consulta ao mesmo tempo todos os anos informados e junta as doações desta
+    pessoa (cnpj_ou_cpf) numa única tabela, com os campos em
+    "perfil_doador.campos". Retorna uma tupla (tabela, tempos), onde tempos é
+    um dicionário com a duração em segundos da consulta de cada ano.
+
+    O CNPJ ou CPF é validado uma única vez, antes de iniciar as consultas, e o
+    tempo total é o da consulta mais lenta e não a soma de todas. Se alguma
+    das consultas falhar, a exceção dela (como ConsultaFalhou) é levantada
+    aqui, para que quem chama possa tentar de novo.
+
+    >>> tabela, tempos = perfil_doador('85.907.012/0001-57', anos=(2004,))
+    >>> len(tabela)
+    16
+    >>> len(tabela[0]) == len(perfil_doador.campos)
+    True
+    >>> tempos.keys()
+    [2004]
+    '''
+
+    pessoa = pessoa_or_valueerror(cnpj_ou_cpf)
+    for ano in anos:
+        if ano not in doadores:
+            raise ValueError('Ano sem consulta disponível: %s' % ano)
+
+    tabelas = {}
+    tempos = {}
+    erros = []
+
+    def consulta(ano):
+        inicio = time()
+        try:
+            tabelas[ano] = _tabela(ano, pessoa)
+        except:
+            erros.append(sys.exc_info())
+        tempos[ano] = time() - inicio
+        logging.info('Consulta de %d em %.2fs' % (ano, tempos[ano]))
+
+    threads = [Thread(target=consulta, args=(ano,)) for ano in anos]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    if erros:
+        tipo, valor, traceback = erros[0]
+        raise tipo, valor, traceback
+
+    tabela = []
+    for ano in anos:
+        tabela.extend(tabelas[ano])
+
+    return tabela, tempos
+
+perfil_doador.campos = [
+    'Ano',
+    'Candidato',
+    'Número',
+    'Partido',
+    'UF',
+    'Município',
+    'Candidatura',
+    'Data',
+    'Valor',
+    'Tipo',
+]
+
 
 if __name__ == '__main__':
     import doctest